@@ -1,12 +1,205 @@
 import pytest
 from graphene_django.utils.testing import graphql_query
+from graphene_file_upload.django.testing import file_graphql_query
 
 import json
+import re
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Union
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from food.models import Cuisine, Ingredient, Recipe
+from food import cache
+from recipes import admission
+
+
+class QueryBudget:
+    """
+    Measures one GraphQL call and fails the test when it runs more SQL
+    queries, takes longer or allocates more memory than allowed.
+    """
+
+    def __init__(
+        self,
+        max_queries: Union[int, None] = None,
+        max_seconds: Union[float, None] = None,
+        max_memory: Union[int, None] = None,
+    ) -> None:
+        self.max_queries = max_queries
+        self.max_seconds = max_seconds
+        self.max_memory = max_memory
+        self.queries: list[str] = []
+        self.seconds = 0.0
+        self.peak_memory = 0
+
+    def __enter__(self) -> "QueryBudget":
+        self._capture = CaptureQueriesContext(connection)
+        self._capture.__enter__()
+        # A tracemalloc session started elsewhere keeps running, only the
+        # peak above the memory traced so far counts.
+        self._tracing = self.max_memory is not None
+        self._started_tracing = (
+            self._tracing and not tracemalloc.is_tracing()
+        )
+        if self._started_tracing:
+            tracemalloc.start()
+        if self._tracing:
+            self._baseline, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.seconds = time.perf_counter() - self._started
+        if self._tracing:
+            _, peak = tracemalloc.get_traced_memory()
+            self.peak_memory = peak - self._baseline
+        if self._started_tracing:
+            tracemalloc.stop()
+        self._capture.__exit__(*exc_info)
+        self.queries = [query["sql"] for query in self._capture]
+
+    def check(self) -> None:
+        errors: list[str] = []
+        if (
+            self.max_queries is not None
+            and len(self.queries) > self.max_queries
+        ):
+            errors.append(
+                f"ran {len(self.queries)} SQL queries, budget is "
+                f"{self.max_queries}:\n{self.explain_queries()}"
+            )
+        if self.max_seconds is not None and self.seconds > self.max_seconds:
+            errors.append(
+                f"took {self.seconds:.3f}s, budget is {self.max_seconds:.3f}s"
+            )
+        if self.max_memory is not None and self.peak_memory > self.max_memory:
+            errors.append(
+                f"allocated {self.peak_memory} bytes, budget is "
+                f"{self.max_memory} bytes"
+            )
+
+        if errors:
+            pytest.fail("GraphQL call " + "\n".join(errors), pytrace=False)
+
+    def explain_queries(self) -> str:
+        # Group queries that only differ by their literals, so N+1 patterns
+        # show up as a single line with a large count.
+        shapes = Counter(
+            re.sub(r"\b\d+\b|'[^']*'", "?", query) for query in self.queries
+        )
+        return "\n".join(
+            f"  {count:>4} x {shape}" for shape, count in shapes.most_common()
+        )
+
+
+@pytest.fixture(autouse=True)
+def admission_controller(monkeypatch):
+    """Start every test with empty admission queues and token buckets."""
+    monkeypatch.setattr(admission, "_controller", None)
+
+
+@pytest.fixture(autouse=True)
+def entity_cache(monkeypatch):
+    """
+    Start every test with an empty entity cache, rows of rolled back tests
+    may come back with the same ids.
+    """
+    monkeypatch.setattr(cache, "_cache", None)
+
 
 @pytest.fixture
 def client_query(client):
-    def func(*args, **kwargs):
-        return graphql_query(*args, **kwargs, client=client)
+    def func(
+        *args,
+        max_queries: Union[int, None] = None,
+        max_seconds: Union[float, None] = None,
+        max_memory: Union[int, None] = None,
+        **kwargs,
+    ):
+        budget = QueryBudget(max_queries, max_seconds, max_memory)
+        with budget:
+            if kwargs.get("files"):
+                response = file_graphql_query(*args, **kwargs, client=client)
+            else:
+                response = graphql_query(*args, **kwargs, client=client)
+
+        response.budget = budget
+        budget.check()
+        return response
+
+    return func
+
+
+@pytest.fixture
+def seed_catalogue(db):
+    """
+    Seed ``recipes`` recipes spread over ``cuisines`` cuisines, each using
+    ``ingredients_per_recipe`` of ``ingredients`` ingredients, with one
+    ``bulk_create`` per table.
+    """
+
+    def func(
+        recipes: int,
+        cuisines: int = 5,
+        ingredients: int = 20,
+        ingredients_per_recipe: int = 3,
+    ) -> dict[str, list[int]]:
+        cuisine_ids = bulk_create_ids(
+            Cuisine, [Cuisine(name=f"cuisine {i}") for i in range(cuisines)]
+        )
+        ingredient_ids = bulk_create_ids(
+            Ingredient,
+            [
+                Ingredient(name=f"ingredient {i}", origin=f"origin {i}")
+                for i in range(ingredients)
+            ],
+        )
+        recipe_ids = bulk_create_ids(
+            Recipe,
+            [
+                Recipe(
+                    name=f"recipe {i}",
+                    steps="mix",
+                    cuisine_id=cuisine_ids[i % cuisines],
+                )
+                for i in range(recipes)
+            ],
+        )
+
+        Through = Recipe.ingredients.through
+        Through.objects.bulk_create(
+            [
+                Through(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_ids[(i + j) % ingredients],
+                )
+                for i, recipe_id in enumerate(recipe_ids)
+                for j in range(min(ingredients_per_recipe, ingredients))
+            ],
+            batch_size=5000,
+        )
+
+        return {
+            "cuisines": cuisine_ids,
+            "ingredients": ingredient_ids,
+            "recipes": recipe_ids,
+        }
 
     return func
 
+
+def bulk_create_ids(model, objs) -> list[int]:
+    # SQLite does not return primary keys from bulk_create, read them back.
+    last_id = model.objects.order_by("-id").values_list("id", flat=True)
+    before = last_id.first() or 0
+    model.objects.bulk_create(objs, batch_size=5000)
+    return list(
+        model.objects.filter(id__gt=before)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
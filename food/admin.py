@@ -1,6 +1,156 @@
-from django.contrib import admin
+from typing import Any, Union
+
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.models import DELETION, LogEntry
+from django.contrib.contenttypes.models import ContentType
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import QuerySet
+from django.http import HttpRequest
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
 
 from food.models import Cuisine, Ingredient, Recipe
 
 
-admin.site.register([Cuisine, Ingredient, Recipe])
+def estimated_rows(queryset: QuerySet[Any]) -> Union[int, None]:
+    """The planner's row count estimate for the table of ``queryset``."""
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # reltuples is -1 (or 0 on older servers) until the table is analyzed.
+    return row[0] if row and row[0] > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginates without ``COUNT(*)`` over the whole table.
+
+    Unfiltered lists past ``max_count`` rows use the planner statistics on
+    PostgreSQL. Everything else counts at most ``max_count`` rows, so only
+    that many can be paged through, searching narrows the rest down.
+    """
+
+    max_count = 10000
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+
+        if not queryset.query.where:
+            estimate = estimated_rows(queryset)
+            if estimate is not None and estimate > self.max_count:
+                return estimate
+        return queryset.order_by()[: self.max_count].count()
+
+
+class FoodModelAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Skips the second, unfiltered COUNT(*) shown next to search results.
+    show_full_result_count = False
+    search_fields = ("^name",)
+    actions = ["delete_in_chunks"]
+    action_chunk_size = 1000
+
+    def get_actions(self, request: HttpRequest) -> dict[str, Any]:
+        # delete_selected loads and renders every related object of the
+        # selection on its confirmation page.
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    @admin.action(
+        permissions=["delete"], description="Delete selected (in chunks)"
+    )
+    def delete_in_chunks(
+        self, request: HttpRequest, queryset: QuerySet[Any]
+    ) -> Union[TemplateResponse, None]:
+        """
+        Delete the selection ``action_chunk_size`` rows per transaction, so
+        selecting across a large table does not hold one huge transaction.
+        The confirmation page only shows how many rows are selected, up to
+        the ``max_count`` of the paginator.
+        """
+        opts = self.model._meta
+        if request.POST.get("post") != "yes":
+            # Counted like the changelist: a selection across a huge table
+            # is not counted exactly.
+            paginator = self.get_paginator(request, queryset, 1)
+            request.current_app = self.admin_site.name
+            return TemplateResponse(
+                request,
+                "admin/food/delete_in_chunks_confirmation.html",
+                {
+                    **self.admin_site.each_context(request),
+                    "title": "Are you sure?",
+                    "opts": opts,
+                    "media": self.media,
+                    "count": paginator.count,
+                    "max_count": paginator.max_count,
+                    "objects_name": opts.verbose_name_plural,
+                    "select_across": request.POST.get("select_across"),
+                    "selected": request.POST.getlist(
+                        helpers.ACTION_CHECKBOX_NAME
+                    ),
+                    "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+                },
+            )
+
+        content_type = ContentType.objects.get_for_model(self.model)
+        pks = queryset.order_by("pk").values_list("pk", flat=True)
+        deleted = 0
+        while True:
+            chunk = list(pks[: self.action_chunk_size])
+            if not chunk:
+                break
+            with transaction.atomic(using=queryset.db):
+                chunk_queryset = self.model._default_manager.filter(
+                    pk__in=chunk
+                )
+                LogEntry.objects.bulk_create(
+                    LogEntry(
+                        user_id=request.user.pk,
+                        content_type_id=content_type.pk,
+                        object_id=str(obj.pk),
+                        object_repr=str(obj)[:200],
+                        action_flag=DELETION,
+                    )
+                    for obj in chunk_queryset
+                )
+                _, per_model = chunk_queryset.delete()
+            deleted += per_model.get(opts.label, 0)
+
+        self.message_user(
+            request,
+            f"Deleted {deleted} {opts.verbose_name_plural}.",
+            messages.SUCCESS,
+        )
+        return None
+
+
+@admin.register(Ingredient)
+class IngredientAdmin(FoodModelAdmin):
+    list_display = ("name", "origin")
+
+
+@admin.register(Cuisine)
+class CuisineAdmin(FoodModelAdmin):
+    list_display = ("name", "banner")
+
+
+@admin.register(Recipe)
+class RecipeAdmin(FoodModelAdmin):
+    list_display = ("name", "cuisine")
+    list_select_related = ("cuisine",)
+    # Only the selected options are rendered, the rest is searched by name.
+    autocomplete_fields = ("cuisine", "ingredients")
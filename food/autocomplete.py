@@ -0,0 +1,273 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from collections.abc import Callable, Iterable
+from typing import Any, TypeVar, Union
+
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+from django.db import models, transaction
+from django.db.models import Count
+
+from food.models import Cuisine, Ingredient
+
+
+ModelT = TypeVar("ModelT", bound=models.Model)
+
+# Columns kept in memory to answer without the database, the name first.
+FIELDS: dict[type[models.Model], tuple[str, ...]] = {
+    Ingredient: ("name", "origin"),
+    Cuisine: ("name", "banner"),
+}
+# Results of the most recent searches are kept until the next change, short
+# prefixes match the most entries and are typed the most.
+CACHE_SIZE = 1024
+# Greatest code point, sorts after anything starting with a given prefix.
+PREFIX_END = chr(0x10FFFF)
+# Cache key of a counter bumped by every committed change of a model's
+# rows, indexes built before the last bump are read again.
+GENERATION_KEY = "autocomplete:generation:{}"
+
+
+class PrefixIndex:
+    """
+    The rows of a model sorted by case-folded name, so the names starting
+    with a prefix are one contiguous ``bisect`` range. Matches are ranked by
+    how many recipes use them, then by name.
+    """
+
+    def __init__(self, model: type[models.Model]) -> None:
+        self.model = model
+        self.fields = FIELDS[model]
+        self.keys: list[tuple[str, int]] = []
+        self.values: dict[int, tuple[Any, ...]] = {}
+        self.usage: dict[int, int] = {}
+        self.generation = 0
+        self._cache: dict[tuple[str, int], list[int]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, model: type[models.Model]) -> "PrefixIndex":
+        index = cls(model)
+        # Read first, a change committed during the build is read again.
+        index.generation = generation(model)
+        rows = (
+            model._default_manager.annotate(usage=Count("recipes"))
+            .order_by()
+            .values_list("id", *index.fields, "usage")
+        )
+        for pk, *values, usage in rows.iterator():
+            index.values[pk] = tuple(values)
+            index.usage[pk] = usage
+            index.keys.append((str(values[0]).casefold(), pk))
+        index.keys.sort()
+        return index
+
+    def search(self, prefix: str, first: int = 10) -> list[Any]:
+        """
+        Up to ``first`` unsaved instances built from the indexed columns,
+        for the rows whose name starts with ``prefix`` (ignoring case).
+        """
+        key = prefix.casefold()
+        with self._lock:
+            pks = self._cache.get((key, first))
+            if pks is None:
+                lo = bisect_left(self.keys, (key,))
+                hi = bisect_left(self.keys, (key + PREFIX_END,), lo)
+                pks = [
+                    pk
+                    for _, name, pk in heapq.nsmallest(
+                        first,
+                        (
+                            (-self.usage[pk], name, pk)
+                            for name, pk in self.keys[lo:hi]
+                        ),
+                    )
+                ]
+                if len(self._cache) >= CACHE_SIZE:
+                    self._cache.clear()
+                self._cache[key, first] = pks
+            rows = [(pk, self.values[pk]) for pk in pks]
+
+        return [
+            self.model(pk=pk, **dict(zip(self.fields, values)))
+            for pk, values in rows
+        ]
+
+    def put(self, obj: models.Model) -> None:
+        values = tuple(
+            obj._meta.get_field(field).get_prep_value(getattr(obj, field))
+            for field in self.fields
+        )
+        with self._lock:
+            self._remove_key(obj.pk)
+            self.values[obj.pk] = values
+            self.usage.setdefault(obj.pk, 0)
+            insort(self.keys, (str(values[0]).casefold(), obj.pk))
+            self._cache.clear()
+
+    def remove(self, pk: int) -> None:
+        with self._lock:
+            self._remove_key(pk)
+            self.values.pop(pk, None)
+            self.usage.pop(pk, None)
+            self._cache.clear()
+
+    def _remove_key(self, pk: int) -> None:
+        if pk not in self.values:
+            return
+        key = (str(self.values[pk][0]).casefold(), pk)
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def add_usage(self, pks: Iterable[int], delta: int) -> None:
+        with self._lock:
+            for pk in pks:
+                if pk in self.usage:
+                    self.usage[pk] = max(self.usage[pk] + delta, 0)
+            self._cache.clear()
+
+    def recount(self, using: Union[str, None] = None) -> None:
+        """Read how many recipes use each row again, with one query."""
+        usage = dict(
+            self.model._default_manager.using(using)
+            .annotate(usage=Count("recipes"))
+            .order_by()
+            .values_list("id", "usage")
+        )
+        with self._lock:
+            for pk in self.usage:
+                self.usage[pk] = usage.get(pk, 0)
+            self._cache.clear()
+
+    def follow(self, generation: int) -> None:
+        """Mark the change bumping to ``generation`` as applied."""
+        with self._lock:
+            if self.generation == generation - 1:
+                self.generation = generation
+
+
+_indexes: dict[type[models.Model], PrefixIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _generations() -> BaseCache:
+    return caches[settings.AUTOCOMPLETE_CACHE_ALIAS]
+
+
+def generation(model: type[models.Model]) -> int:
+    return _generations().get(GENERATION_KEY.format(model._meta.label), 0)
+
+
+def _bump(model: type[models.Model]) -> int:
+    key = GENERATION_KEY.format(model._meta.label)
+    shared = _generations()
+    try:
+        return shared.incr(key)
+    except ValueError:
+        # Not bumped yet, or evicted.
+        if shared.add(key, 1, None):
+            return 1
+        return shared.incr(key)
+
+
+def get_prefix_index(model: type[models.Model]) -> PrefixIndex:
+    """
+    The index of ``model`` for this process, read on first use and again
+    once a change was committed by another process.
+    """
+    current = generation(model)
+    with _indexes_lock:
+        index = _indexes.get(model)
+        if index is None or index.generation != current:
+            index = _indexes[model] = PrefixIndex.build(model)
+        return index
+
+
+def autocomplete(
+    model: type[ModelT], prefix: str, first: int = 10
+) -> list[ModelT]:
+    return get_prefix_index(model).search(prefix, first)
+
+
+def is_loaded() -> bool:
+    return bool(_indexes)
+
+
+class Change:
+    """
+    A change of the rows of ``model``, applied to the index of this process
+    once the transaction commits (or read with the whole index again when
+    ``apply`` is None). It bumps the generation of ``model`` too, so the
+    other processes read their index again.
+    """
+
+    def __init__(
+        self,
+        model: type[models.Model],
+        apply: Union[Callable[[PrefixIndex], None], None],
+    ) -> None:
+        self.model = model
+        self.apply = apply
+
+    def __call__(self) -> None:
+        bumped = _bump(self.model)
+        index = _indexes.get(self.model)
+        if index is not None and self.apply is not None:
+            self.apply(index)
+            index.follow(bumped)
+
+
+class Recount(Change):
+    def __init__(
+        self, model: type[models.Model], using: Union[str, None]
+    ) -> None:
+        super().__init__(model, lambda index: index.recount(using))
+
+
+def _pending_recount(
+    model: type[models.Model], using: Union[str, None]
+) -> bool:
+    return any(
+        isinstance(callback, Recount) and callback.model is model
+        for _, callback, *_ in transaction.get_connection(using).run_on_commit
+    )
+
+
+def changed(
+    model: type[models.Model],
+    apply: Union[Callable[[PrefixIndex], None], None] = None,
+    using: Union[str, None] = None,
+) -> None:
+    transaction.on_commit(Change(model, apply), using)
+
+
+def saved(obj: models.Model) -> None:
+    changed(type(obj), lambda index: index.put(obj))
+
+
+def deleted(model: type[models.Model], pk: int) -> None:
+    changed(model, lambda index: index.remove(pk))
+
+
+def used(
+    model: type[models.Model],
+    pks: Iterable[Union[int, None]],
+    delta: int = 1,
+    using: Union[str, None] = None,
+) -> None:
+    """Count ``delta`` more recipes using each of ``pks``."""
+    pks = [pk for pk in pks if pk is not None]
+    if pks and not _pending_recount(model, using):
+        changed(model, lambda index: index.add_usage(pks, delta), using)
+
+
+def recount(model: type[models.Model], using: Union[str, None] = None) -> None:
+    """
+    Count the recipes using each row of ``model`` again once the
+    transaction commits, for changes whose links are gone by then. Counted
+    once per transaction, covering the ``used`` calls made after it.
+    """
+    if not _pending_recount(model, using):
+        transaction.on_commit(Recount(model, using), using)
@@ -0,0 +1,234 @@
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+from collections.abc import Iterable
+from functools import lru_cache
+from typing import Any, TypeVar, Union
+
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+from django.db import models, transaction
+
+from food.models import Cuisine, Ingredient
+
+
+ModelT = TypeVar("ModelT", bound=models.Model)
+
+# Small tables read on nearly every request and rarely written.
+CACHED_MODELS = (Cuisine, Ingredient)
+LOCAL_HIT = "local_hit"
+SHARED_HIT = "shared_hit"
+MISS = "miss"
+
+Row = tuple[Any, ...]
+
+
+def _columns(model: type[models.Model]) -> list[str]:
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+@lru_cache(maxsize=None)
+def _version(columns: tuple[str, ...]) -> str:
+    return hashlib.md5(",".join(columns).encode()).hexdigest()[:8]
+
+
+def _generation_key(key: str) -> str:
+    return f"{key}:generation"
+
+
+class EntityCache:
+    """
+    Read-through cache of rows by primary key.
+
+    Rows are looked up in a bounded in-process LRU, then in the optional
+    ``shared`` Django cache, then loaded with one query for all the misses.
+    Only column values are cached, every lookup builds new instances.
+
+    Saves and deletes invalidate both tiers of their own process, and bump
+    the generation of the row in the shared cache. A lookup only stores the
+    rows it read when they were not invalidated meanwhile, so a read racing
+    a change cannot put the old row back. Other processes keep a row in
+    their LRU for at most ``local_timeout`` seconds.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        local_timeout: float = 30.0,
+        shared: Union[BaseCache, None] = None,
+        shared_timeout: Union[int, None] = 300,
+    ) -> None:
+        self.max_entries = max_entries
+        self.local_timeout = local_timeout
+        self.shared = shared
+        self.shared_timeout = shared_timeout
+        self.stats: Counter[tuple[str, str]] = Counter()
+        self._rows: OrderedDict[str, tuple[float, Row]] = OrderedDict()
+        # Invalidations so far, the most recent ``max_entries`` by key, and
+        # the last one forgotten.
+        self._invalidations = 0
+        self._invalidated: OrderedDict[str, int] = OrderedDict()
+        self._forgotten = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: type[models.Model], pk: Any) -> str:
+        # Rows are cached by position: processes running with other columns
+        # (during a deploy) must not read each other's rows.
+        version = _version(tuple(_columns(model)))
+        return f"entity:{model._meta.label_lower}:{version}:{pk}"
+
+    def get_many(
+        self, model: type[ModelT], pks: Iterable[Any]
+    ) -> dict[Any, ModelT]:
+        columns = _columns(model)
+        keys = {self.key(model, pk): pk for pk in dict.fromkeys(pks)}
+        rows: dict[Any, Row] = {}
+        now = time.monotonic()
+        with self._lock:
+            since = self._invalidations
+            for key, pk in keys.items():
+                entry = self._rows.get(key)
+                if entry is None:
+                    continue
+                if entry[0] < now:
+                    del self._rows[key]
+                    continue
+                self._rows.move_to_end(key)
+                rows[pk] = entry[1]
+        self._count(model, LOCAL_HIT, len(rows))
+
+        missing = {key: pk for key, pk in keys.items() if pk not in rows}
+        generations: dict[str, int] = {}
+        if missing and self.shared is not None:
+            found = self.shared.get_many(
+                [*missing, *map(_generation_key, missing)]
+            )
+            generations = {
+                key: found.pop(_generation_key(key), 0) for key in missing
+            }
+            for key, row in found.items():
+                rows[missing.pop(key)] = tuple(row)
+            self._store(model, found, since)
+            self._count(model, SHARED_HIT, len(found))
+
+        if missing:
+            pk_index = columns.index(model._meta.pk.attname)
+            loaded = {
+                self.key(model, row[pk_index]): row
+                for row in model._default_manager.filter(
+                    pk__in=list(missing.values())
+                ).values_list(*columns)
+            }
+            rows.update((missing[key], row) for key, row in loaded.items())
+            self._store(model, loaded, since, generations)
+            self._count(model, MISS, len(missing))
+
+        db = model._default_manager.db
+        return {
+            pk: model.from_db(db, columns, list(row))
+            for pk, row in rows.items()
+        }
+
+    def _store(
+        self,
+        model: type[models.Model],
+        rows: dict[str, Row],
+        since: int,
+        generations: Union[dict[str, int], None] = None,
+    ) -> None:
+        """
+        Keep ``rows`` looked up after ``since`` invalidations, and in the
+        shared cache too given the ``generations`` of their keys before the
+        lookup. Rows invalidated meanwhile are left out.
+        """
+        if not rows:
+            return
+
+        expires = time.monotonic() + self.local_timeout
+        with self._lock:
+            for key, row in rows.items():
+                if self._forgotten > since or (
+                    self._invalidated.get(key, 0) > since
+                ):
+                    continue
+                self._rows[key] = (expires, tuple(row))
+                self._rows.move_to_end(key)
+            while len(self._rows) > self.max_entries:
+                self._rows.popitem(last=False)
+
+        if generations is not None and self.shared is not None:
+            self.shared.set_many(
+                {key: list(row) for key, row in rows.items()},
+                self.shared_timeout,
+            )
+            # Checked once stored: invalidations bump the generation before
+            # deleting the row, those after the check delete it themselves.
+            current = self.shared.get_many(list(map(_generation_key, rows)))
+            stale = [
+                key
+                for key in rows
+                if current.get(_generation_key(key), 0)
+                != generations.get(key, 0)
+            ]
+            if stale:
+                self.shared.delete_many(stale)
+
+    def _count(self, model: type[models.Model], result: str, n: int) -> None:
+        if n:
+            with self._lock:
+                self.stats[model._meta.label, result] += n
+
+    def invalidate(self, model: type[models.Model], pk: Any) -> None:
+        key = self.key(model, pk)
+        with self._lock:
+            self._rows.pop(key, None)
+            self._invalidations += 1
+            self._invalidated[key] = self._invalidations
+            self._invalidated.move_to_end(key)
+            if len(self._invalidated) > self.max_entries:
+                _, self._forgotten = self._invalidated.popitem(last=False)
+        if self.shared is not None:
+            generation = _generation_key(key)
+            try:
+                self.shared.incr(generation)
+            except ValueError:
+                # Never bumped, or expired.
+                if not self.shared.add(generation, 1, self.shared_timeout):
+                    self.shared.incr(generation)
+            self.shared.delete(key)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+_cache: Union[EntityCache, None] = None
+_cache_lock = threading.Lock()
+
+
+def get_entity_cache() -> EntityCache:
+    global _cache  # pylint: disable=global-statement
+    with _cache_lock:
+        if _cache is None:
+            alias = settings.ENTITY_CACHE_ALIAS
+            _cache = EntityCache(
+                max_entries=settings.ENTITY_CACHE_MAX_ENTRIES,
+                local_timeout=settings.ENTITY_CACHE_LOCAL_TIMEOUT,
+                shared=caches[alias] if alias else None,
+                shared_timeout=settings.ENTITY_CACHE_SHARED_TIMEOUT,
+            )
+        return _cache
+
+
+def invalidate(model: type[models.Model], pk: Any) -> None:
+    """
+    Drop a changed row now, and again once the transaction commits, so
+    lookups that read the old row before the commit do not store it.
+    """
+    if model not in CACHED_MODELS:
+        return
+
+    cache = get_entity_cache()
+    cache.invalidate(model, pk)
+    transaction.on_commit(lambda: cache.invalidate(model, pk))
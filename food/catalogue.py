@@ -0,0 +1,457 @@
+import csv
+import io
+import json
+import os
+import time
+from collections.abc import Callable, Iterable, Iterator
+from functools import partial
+from itertools import islice
+from typing import IO, Any, NamedTuple, Union
+
+from django.db import connections, models, transaction
+
+from food import autocomplete
+from food.models import Cuisine, Ingredient, Recipe
+
+
+FORMATS = ("ndjson", "csv")
+CSV_FIELDS = ["name", "steps", "cuisine", "ingredients"]
+# Ingredients are written as ``name:origin`` pairs joined by ``|`` in CSV.
+CSV_INGREDIENT_SEPARATOR = "|"
+CSV_ORIGIN_SEPARATOR = ":"
+
+
+class CatalogueError(Exception):
+    pass
+
+
+class RecipeRow(NamedTuple):
+    name: str
+    steps: str
+    cuisine: str
+    ingredients: tuple[tuple[str, str], ...]
+
+
+def guess_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    if ext in ("jsonl", "ndjson", "json"):
+        return "ndjson"
+    if ext == "csv":
+        return "csv"
+    raise CatalogueError(f"cannot guess the format of {path}, use --format")
+
+
+def _ingredient(value: Any) -> tuple[str, str]:
+    if isinstance(value, dict):
+        return str(value["name"]).strip(), str(value.get("origin") or "")
+    name, _, origin = str(value).partition(CSV_ORIGIN_SEPARATOR)
+    return name.strip(), origin.strip()
+
+
+def _check_length(
+    line: int, model: type[models.Model], field: str, value: str
+) -> None:
+    max_length = model._meta.get_field(field).max_length
+    if len(value) > max_length:
+        raise CatalogueError(
+            f"line {line}: {model._meta.verbose_name} {field} {value!r} is "
+            f"longer than {max_length} characters"
+        )
+
+
+def _row(line: int, record: dict[str, Any]) -> RecipeRow:
+    ingredients = record.get("ingredients") or ()
+    if isinstance(ingredients, str):
+        ingredients = [
+            i for i in ingredients.split(CSV_INGREDIENT_SEPARATOR) if i
+        ]
+
+    try:
+        row = RecipeRow(
+            name=str(record["name"]).strip(),
+            steps=str(record.get("steps") or ""),
+            cuisine=str(record["cuisine"]).strip(),
+            ingredients=tuple(_ingredient(i) for i in ingredients),
+        )
+    except (KeyError, TypeError) as exc:
+        raise CatalogueError(f"line {line}: invalid recipe ({exc!r})")
+
+    # Checked here, the database would abort the whole chunk (or COPY).
+    _check_length(line, Recipe, "name", row.name)
+    _check_length(line, Cuisine, "name", row.cuisine)
+    for name, origin in row.ingredients:
+        _check_length(line, Ingredient, "name", name)
+        _check_length(line, Ingredient, "origin", origin)
+    return row
+
+
+def read_catalogue(file: IO[str], fmt: str) -> Iterator[RecipeRow]:
+    """Stream recipes out of an NDJSON or CSV file, one row at a time."""
+    if fmt == "csv":
+        for line, record in enumerate(csv.DictReader(file), start=2):
+            yield _row(line, record)
+        return
+
+    for line, text in enumerate(file, start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError as exc:
+            raise CatalogueError(f"line {line}: {exc}")
+        yield _row(line, record)
+
+
+def write_catalogue(file: IO[str], fmt: str, rows: Iterable[RecipeRow]) -> int:
+    count = 0
+    writer = csv.DictWriter(file, CSV_FIELDS) if fmt == "csv" else None
+    if writer:
+        writer.writeheader()
+
+    for row in rows:
+        count += 1
+        if writer:
+            writer.writerow(
+                {
+                    "name": row.name,
+                    "steps": row.steps,
+                    "cuisine": row.cuisine,
+                    "ingredients": CSV_INGREDIENT_SEPARATOR.join(
+                        f"{name}{CSV_ORIGIN_SEPARATOR}{origin}"
+                        for name, origin in row.ingredients
+                    ),
+                }
+            )
+            continue
+
+        record = row._asdict()
+        record["ingredients"] = [
+            {"name": name, "origin": origin}
+            for name, origin in row.ingredients
+        ]
+        file.write(json.dumps(record) + "\n")
+
+    return count
+
+
+def export_rows(
+    chunk_size: int = 5000, using: str = "default"
+) -> Iterator[RecipeRow]:
+    """
+    Walk recipes by primary key pages, resolving their cuisine and
+    ingredients from in-memory maps and one through-table query per page.
+    """
+    cuisines = dict(Cuisine.objects.using(using).values_list("id", "name"))
+    ingredients = {
+        pk: (name, origin)
+        for pk, name, origin in Ingredient.objects.using(using).values_list(
+            "id", "name", "origin"
+        )
+    }
+    Through = Recipe.ingredients.through
+
+    last_id = 0
+    while True:
+        page = list(
+            Recipe.objects.using(using)
+            .filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "name", "steps", "cuisine_id")[:chunk_size]
+        )
+        if not page:
+            return
+
+        links: dict[int, list[int]] = {}
+        for recipe_id, ingredient_id in (
+            Through.objects.using(using)
+            .filter(recipe_id__in=[row[0] for row in page])
+            .order_by("id")
+            .values_list("recipe_id", "ingredient_id")
+        ):
+            links.setdefault(recipe_id, []).append(ingredient_id)
+
+        for recipe_id, name, steps, cuisine_id in page:
+            yield RecipeRow(
+                name=name,
+                steps=steps,
+                cuisine=cuisines[cuisine_id],
+                ingredients=tuple(
+                    ingredients[i] for i in links.get(recipe_id, [])
+                ),
+            )
+
+        last_id = page[-1][0]
+
+
+class CatalogueLoader:
+    """
+    Loads recipes set-wise, one transaction per chunk.
+
+    Cuisines and ingredients are deduplicated by name against in-memory
+    ``name -> id`` maps seeded from the database, so each chunk only inserts
+    names it has not seen before. On PostgreSQL and SQLite primary keys are
+    reserved up front, which lets rows be written with ``COPY`` (PostgreSQL)
+    or ``bulk_create`` without reading them back.
+    """
+
+    def __init__(self, using: str = "default", chunk_size: int = 5000):
+        self.using = using
+        self.chunk_size = chunk_size
+        self.connection = connections[using]
+        self.cuisines = self._name_map(Cuisine)
+        self.ingredients = self._name_map(Ingredient)
+
+    def _name_map(self, model: type[models.Model]) -> dict[str, int]:
+        # Iterate newest first so the oldest row wins for duplicated names,
+        # like ``get_or_create`` would pick it.
+        return dict(
+            model._default_manager.using(self.using)
+            .order_by("-id")
+            .values_list("name", "id")
+        )
+
+    def load(
+        self,
+        rows: Iterable[RecipeRow],
+        on_chunk: Union[Callable[[int], None], None] = None,
+        before_commit: Union[Callable[[int, list[int]], None], None] = None,
+    ) -> int:
+        """
+        Load ``rows`` and return how many were loaded. ``before_commit`` is
+        called inside the transaction of every chunk with the running total
+        and the ids of the chunk's recipes, ``on_chunk`` with the running
+        total once the chunk is committed.
+        """
+        total = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return total
+
+            loaded = total + len(chunk)
+            self.load_chunk(
+                chunk,
+                partial(before_commit, loaded) if before_commit else None,
+            )
+            total = loaded
+            if on_chunk is not None:
+                on_chunk(total)
+
+    def load_chunk(
+        self,
+        chunk: list[RecipeRow],
+        before_commit: Union[Callable[[list[int]], None], None] = None,
+    ) -> None:
+        with transaction.atomic(using=self.using):
+            self._add_names(
+                Cuisine, self.cuisines, {row.cuisine: () for row in chunk}
+            )
+            self._add_names(
+                Ingredient,
+                self.ingredients,
+                {
+                    name: (origin,)
+                    for row in reversed(chunk)
+                    for name, origin in reversed(row.ingredients)
+                },
+            )
+
+            recipe_ids = self._create(
+                Recipe,
+                ["name", "steps", "cuisine_id"],
+                [
+                    (row.name, row.steps, self.cuisines[row.cuisine])
+                    for row in chunk
+                ],
+            )
+            self._insert(
+                Recipe.ingredients.through,
+                ["recipe_id", "ingredient_id"],
+                [
+                    (pk, ingredient_id)
+                    for pk, row in zip(recipe_ids, chunk)
+                    for ingredient_id in dict.fromkeys(
+                        self.ingredients[name] for name, _ in row.ingredients
+                    )
+                ],
+            )
+            # Rows written in bulk send no signals.
+            autocomplete.changed(Cuisine, using=self.using)
+            autocomplete.changed(Ingredient, using=self.using)
+            if before_commit is not None:
+                before_commit(recipe_ids)
+
+    def _add_names(
+        self,
+        model: type[models.Model],
+        ids: dict[str, int],
+        names: dict[str, tuple[str, ...]],
+    ) -> None:
+        """
+        Insert the ``names`` missing from ``ids`` and record their new ids.
+        The values of ``names`` fill the model's remaining columns.
+        """
+        missing = [name for name in names if name not in ids]
+        if not missing:
+            return
+
+        columns = ["name"] + (["origin"] if model is Ingredient else [])
+        new_ids = self._create(
+            model, columns, [(name, *names[name]) for name in missing]
+        )
+        ids.update(zip(missing, new_ids))
+
+    def _create(
+        self,
+        model: type[models.Model],
+        columns: list[str],
+        rows: list[tuple[Any, ...]],
+    ) -> list[int]:
+        """Insert ``rows`` of a model and return their ids, in order."""
+        ids = self._reserve_ids(model, len(rows))
+        if ids is not None:
+            self._insert(
+                model,
+                ["id", *columns],
+                [(pk, *row) for pk, row in zip(ids, rows)],
+            )
+            return ids
+
+        objs = [model(**dict(zip(columns, row))) for row in rows]
+        if self.connection.features.can_return_rows_from_bulk_insert:
+            model._default_manager.using(self.using).bulk_create(
+                objs, batch_size=self.chunk_size
+            )
+        else:
+            # Without reserved ids or ids returned by bulk inserts, only
+            # single inserts tell which id each row got.
+            for obj in objs:
+                obj.save(using=self.using, force_insert=True)
+        return [obj.pk for obj in objs]
+
+    def _reserve_ids(
+        self, model: type[models.Model], count: int
+    ) -> Union[list[int], None]:
+        """
+        Take ``count`` ids for new rows up front, ``None`` when the backend
+        cannot hand them out safely.
+        """
+        table = model._meta.db_table
+        vendor = self.connection.vendor
+        if vendor not in ("postgresql", "sqlite"):
+            return None
+
+        with self.connection.cursor() as cursor:
+            if vendor == "postgresql":
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+                    "FROM generate_series(1, %s)",
+                    [table, count],
+                )
+                return [row[0] for row in cursor.fetchall()]
+
+            # SQLite lets a single connection write to the database at a
+            # time, so the ids above the current maximum are ours.
+            cursor.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM "
+                + self.connection.ops.quote_name(table)
+            )
+            start = cursor.fetchone()[0] + 1
+            return list(range(start, start + count))
+
+    def _insert(
+        self,
+        model: type[models.Model],
+        columns: list[str],
+        rows: list[tuple[Any, ...]],
+    ) -> None:
+        if not rows:
+            return
+
+        if self.connection.vendor != "postgresql":
+            model._default_manager.using(self.using).bulk_create(
+                [model(**dict(zip(columns, row))) for row in rows],
+                batch_size=self.chunk_size,
+            )
+            return
+
+        # COPY reads unquoted empty fields as NULL, quote every string so
+        # empty origins and steps stay empty strings.
+        buffer = io.StringIO()
+        csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+        buffer.seek(0)
+        quote = self.connection.ops.quote_name
+        with self.connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {quote(model._meta.db_table)} "
+                f"({', '.join(quote(c) for c in columns)}) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+
+
+class Checkpoint:
+    """
+    Remembers how many rows of a source file were committed, so an
+    interrupted import can skip them when it is started again.
+
+    Each chunk is first recorded as pending from inside its transaction,
+    with the id of one of its recipes, and confirmed once committed. A
+    pending chunk whose recipe exists was committed before the import was
+    interrupted.
+    """
+
+    def __init__(
+        self, path: Union[str, None], source: str, using: str = "default"
+    ):
+        self.path = path
+        self.source = os.path.abspath(source)
+        self.rows = 0
+        if path and os.path.exists(path):
+            with open(path) as file:
+                state = json.load(file)
+            if state.get("source") == self.source:
+                self.rows = state["rows"]
+                pending = state.get("pending")
+                if (
+                    pending
+                    and Recipe.objects.using(using)
+                    .filter(pk=pending["recipe_id"])
+                    .exists()
+                ):
+                    self.rows = pending["rows"]
+
+    def prepare(self, rows: int, recipe_ids: list[int]) -> None:
+        """Record a chunk ending at ``rows`` as pending."""
+        self._write({"pending": {"rows": rows, "recipe_id": recipe_ids[-1]}})
+
+    def save(self, rows: int) -> None:
+        self.rows = rows
+        self._write({})
+
+    def _write(self, state: dict[str, Any]) -> None:
+        if not self.path:
+            return
+
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as file:
+            json.dump(
+                {"source": self.source, "rows": self.rows, **state}, file
+            )
+        os.replace(tmp, self.path)
+
+    def skip(self, rows: Iterator[RecipeRow]) -> Iterator[RecipeRow]:
+        return islice(rows, self.rows, None)
+
+
+class Progress:
+    def __init__(self, report: Callable[[str], None], start: int = 0):
+        self.report = report
+        self.start = start
+        self.started = time.perf_counter()
+
+    def __call__(self, rows: int) -> None:
+        elapsed = time.perf_counter() - self.started
+        rate = (rows - self.start) / elapsed if elapsed else 0.0
+        self.report(f"{rows} rows ({rate:,.0f} rows/s)")
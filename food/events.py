@@ -0,0 +1,171 @@
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Iterable
+from typing import Any, Union
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+Message = dict[str, Any]
+
+
+def recipe_group(cuisine_id: Union[int, None] = None) -> str:
+    return "recipes" if cuisine_id is None else f"recipes.cuisine.{cuisine_id}"
+
+
+def cuisine_group(cuisine_id: Union[int, None] = None) -> str:
+    return "cuisines" if cuisine_id is None else f"cuisines.{cuisine_id}"
+
+
+class Subscription:
+    """
+    Messages published to a group for one subscriber, consumed with
+    ``async for`` on the subscriber's event loop.
+
+    At most ``max_pending`` messages are kept for a subscriber that does not
+    keep up. Older ones are dropped (and counted in ``dropped``) so a slow
+    consumer never holds back publishers or other subscribers.
+    """
+
+    def __init__(
+        self, layer: "ChannelLayer", group: str, max_pending: int
+    ) -> None:
+        self.layer = layer
+        self.group = group
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.pending: deque[Message] = deque()
+        self.loop = asyncio.get_running_loop()
+        self.ready = asyncio.Event()
+
+    def put(self, message: Message) -> None:
+        """Queue ``message``, safe to call from any thread."""
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The subscriber's loop is gone, it will not read anymore.
+            self.close()
+
+    def _put(self, message: Message) -> None:
+        if len(self.pending) >= self.max_pending:
+            self.pending.popleft()
+            self.dropped += 1
+        self.pending.append(message)
+        self.ready.set()
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> Message:
+        while not self.pending:
+            self.ready.clear()
+            await self.ready.wait()
+        return self.pending.popleft()
+
+    def close(self) -> None:
+        self.layer.unsubscribe(self)
+
+
+class ChannelLayer(ABC):
+    """
+    Fans out change events to subscribers. ``SUBSCRIPTION_CHANNEL_LAYER``
+    selects the implementation, a multi-node deployment needs one backed by
+    a shared broker.
+    """
+
+    def __init__(self, max_pending: int = 100) -> None:
+        self.max_pending = max_pending
+
+    @abstractmethod
+    def publish(self, groups: Iterable[str], message: Message) -> None:
+        ...
+
+    @abstractmethod
+    def subscribe(self, group: str) -> Subscription:
+        ...
+
+    @abstractmethod
+    def unsubscribe(self, subscription: Subscription) -> None:
+        ...
+
+
+class InMemoryChannelLayer(ChannelLayer):
+    """Delivers events to the subscribers of the current process only."""
+
+    def __init__(self, max_pending: int = 100) -> None:
+        super().__init__(max_pending)
+        self.groups: dict[str, set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, groups: Iterable[str], message: Message) -> None:
+        with self._lock:
+            subscribers = [
+                subscription
+                for group in groups
+                for subscription in self.groups.get(group, ())
+            ]
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def subscribe(self, group: str) -> Subscription:
+        subscription = Subscription(self, group, self.max_pending)
+        with self._lock:
+            self.groups.setdefault(group, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self.groups.get(subscription.group, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self.groups.pop(subscription.group, None)
+
+
+_layer: Union[ChannelLayer, None] = None
+_layer_lock = threading.Lock()
+
+
+def get_channel_layer() -> ChannelLayer:
+    global _layer  # pylint: disable=global-statement
+    with _layer_lock:
+        if _layer is None:
+            _layer = import_string(settings.SUBSCRIPTION_CHANNEL_LAYER)(
+                max_pending=settings.SUBSCRIPTION_MAX_PENDING
+            )
+        return _layer
+
+
+def publish(groups: Iterable[str], message: Message) -> None:
+    """Publish ``message`` once the current transaction is committed."""
+    groups = list(groups)
+    transaction.on_commit(lambda: get_channel_layer().publish(groups, message))
+
+
+def recipe_changed(
+    kind: str,
+    recipe_id: int,
+    cuisine_id: int,
+    previous_cuisine_id: Union[int, None] = None,
+) -> None:
+    """
+    A recipe moved to another cuisine is published to the subscribers of
+    both cuisines.
+    """
+    groups = [recipe_group(), recipe_group(cuisine_id)]
+    if previous_cuisine_id is not None and previous_cuisine_id != cuisine_id:
+        groups.append(recipe_group(previous_cuisine_id))
+    publish(
+        groups,
+        {"kind": kind, "recipe_id": recipe_id, "cuisine_id": cuisine_id},
+    )
+
+
+def cuisine_changed(kind: str, cuisine_id: int) -> None:
+    publish(
+        [cuisine_group(), cuisine_group(cuisine_id)],
+        {"kind": kind, "cuisine_id": cuisine_id},
+    )
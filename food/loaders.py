@@ -0,0 +1,73 @@
+import threading
+from collections.abc import Iterable
+from typing import Any, TypeVar
+
+import graphene
+from django.db import models
+
+from food.cache import CACHED_MODELS, get_entity_cache
+
+
+ModelT = TypeVar("ModelT", bound=models.Model)
+
+
+class ObjectCache:
+    """
+    Identity map shared by every operation of a request, so each
+    ``Cuisine``/``Ingredient`` row is loaded at most once per request, even
+    across the operations of a batch running in several threads. Rows of
+    ``CACHED_MODELS`` are loaded through the process-wide entity cache.
+    """
+
+    def __init__(self) -> None:
+        self._objects: dict[tuple[type[models.Model], Any], models.Model] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: type[ModelT], pk: Any) -> ModelT:
+        objects = self.get_many(model, [pk])
+        if pk not in objects:
+            raise model.DoesNotExist(
+                f"{model._meta.object_name} matching query does not exist."
+            )
+        return objects[pk]
+
+    def get_many(
+        self, model: type[ModelT], pks: Iterable[Any]
+    ) -> dict[Any, ModelT]:
+        pks = list(dict.fromkeys(pks))
+        with self._lock:
+            found = {
+                pk: self._objects[model, pk]
+                for pk in pks
+                if (model, pk) in self._objects
+            }
+
+        missing = [pk for pk in pks if pk not in found]
+        if missing:
+            loaded = self.load(model, missing)
+            with self._lock:
+                for pk, obj in loaded.items():
+                    self._objects[model, pk] = obj
+            found.update(loaded)
+
+        return found  # type: ignore[return-value]
+
+    def load(self, model: type[ModelT], pks: list[Any]) -> dict[Any, ModelT]:
+        if model in CACHED_MODELS:
+            return get_entity_cache().get_many(model, pks)
+        return model._default_manager.in_bulk(pks)
+
+    def prime(self, obj: models.Model) -> None:
+        with self._lock:
+            self._objects[type(obj), obj.pk] = obj
+
+    def discard(self, model: type[models.Model], pk: Any) -> None:
+        with self._lock:
+            self._objects.pop((model, pk), None)
+
+
+def get_object_cache(info: graphene.ResolveInfo) -> ObjectCache:
+    request = info.context
+    if not hasattr(request, "object_cache"):
+        request.object_cache = ObjectCache()
+    return request.object_cache
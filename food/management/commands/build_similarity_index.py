@@ -0,0 +1,50 @@
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+    CommandParser,
+)
+
+from food.recommendations import SimilarityIndex, publish_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the similar recipes matrix from the database and publish it "
+        "as the snapshot shared by the workers."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--directory",
+            default=settings.SIMILARITY_SNAPSHOT_DIR,
+            help="Snapshot directory, SIMILARITY_SNAPSHOT_DIR by default",
+        )
+        parser.add_argument("--chunk-size", type=int, default=10000)
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        directory = options["directory"]
+        if not directory:
+            raise CommandError(
+                "set SIMILARITY_SNAPSHOT_DIR or pass --directory"
+            )
+
+        try:
+            snapshot = publish_snapshot(
+                directory,
+                using=options["database"],
+                chunk_size=options["chunk_size"],
+            )
+            index = SimilarityIndex.load(directory, snapshot)
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"indexed {len(index.recipe_ids)} recipes and "
+                f"{len(index.ingredient_ids)} ingredients into {snapshot}"
+            )
+        )
@@ -0,0 +1,46 @@
+import sys
+from typing import Any
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+    CommandParser,
+)
+
+from food.catalogue import (
+    FORMATS,
+    CatalogueError,
+    export_rows,
+    guess_format,
+    write_catalogue,
+)
+
+
+class Command(BaseCommand):
+    help = "Stream every recipe into an NDJSON or CSV file."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("path", help="Output file, - for stdout")
+        parser.add_argument("--format", choices=FORMATS)
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        path = options["path"]
+        rows = export_rows(options["chunk_size"], options["database"])
+        try:
+            fmt = options["format"] or (
+                "ndjson" if path == "-" else guess_format(path)
+            )
+            if path == "-":
+                write_catalogue(sys.stdout, fmt, rows)
+                return
+
+            with open(path, "w", newline="", encoding="utf-8") as file:
+                count = write_catalogue(file, fmt, rows)
+        except (CatalogueError, OSError) as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(
+            self.style.SUCCESS(f"exported {count} recipes to {path}")
+        )
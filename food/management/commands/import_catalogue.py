@@ -0,0 +1,69 @@
+from typing import Any
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+    CommandParser,
+)
+
+from food.catalogue import (
+    FORMATS,
+    CatalogueError,
+    CatalogueLoader,
+    Checkpoint,
+    Progress,
+    guess_format,
+    read_catalogue,
+)
+
+
+class Command(BaseCommand):
+    help = "Stream recipes from an NDJSON or CSV file into the database."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=FORMATS)
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument(
+            "--checkpoint",
+            help=(
+                "File recording committed rows, an interrupted import resumes "
+                "from it when started again"
+            ),
+        )
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        path = options["path"]
+        try:
+            fmt = options["format"] or guess_format(path)
+            checkpoint = Checkpoint(
+                options["checkpoint"], path, options["database"]
+            )
+            progress = Progress(self.stdout.write, start=checkpoint.rows)
+            loader = CatalogueLoader(
+                options["database"], chunk_size=options["chunk_size"]
+            )
+
+            skipped = checkpoint.rows
+            if skipped:
+                self.stdout.write(f"resuming after {skipped} rows")
+
+            def before_commit(loaded: int, recipe_ids: list[int]) -> None:
+                checkpoint.prepare(skipped + loaded, recipe_ids)
+
+            def on_chunk(loaded: int) -> None:
+                checkpoint.save(skipped + loaded)
+                progress(skipped + loaded)
+
+            with open(path, newline="", encoding="utf-8") as file:
+                rows = checkpoint.skip(read_catalogue(file, fmt))
+                loaded = loader.load(
+                    rows, on_chunk=on_chunk, before_commit=before_commit
+                )
+        except (CatalogueError, OSError) as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(
+            self.style.SUCCESS(f"imported {loaded} recipes from {path}")
+        )
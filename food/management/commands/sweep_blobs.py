@@ -0,0 +1,26 @@
+from typing import Any
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from food.models import Cuisine
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove the media blobs no cuisine references anymore, once they "
+        "are older than BLOB_RELEASE_GRACE."
+    )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if not hasattr(default_storage, "blobs"):
+            raise CommandError("the default storage does not keep blobs")
+
+        referenced = set(
+            Cuisine.objects.exclude(banner="").values_list("banner", flat=True)
+        )
+        removed = sum(
+            default_storage.release(name, int(name in referenced))
+            for name in list(default_storage.blobs())
+        )
+        self.stdout.write(self.style.SUCCESS(f"removed {removed} blobs"))
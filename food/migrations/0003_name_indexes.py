@@ -0,0 +1,72 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:32
+
+from django.db import migrations, models
+
+
+MODELS = ("cuisine", "ingredient", "recipe")
+
+
+def concurrently(statement):
+    return str(statement).replace(
+        "CREATE INDEX", "CREATE INDEX CONCURRENTLY IF NOT EXISTS", 1
+    )
+
+
+def create_name_indexes(apps, schema_editor):
+    # The indexes of db_index on name. PostgreSQL builds them without
+    # blocking writes, which cannot run in a transaction, so the migration
+    # is not atomic. IF NOT EXISTS lets a failed run be started again.
+    postgresql = schema_editor.connection.vendor == "postgresql"
+    for model_name in MODELS:
+        model = apps.get_model("food", model_name)
+        field = model._meta.get_field("name")
+        statements = [schema_editor._create_index_sql(model, fields=[field])]
+        if postgresql:
+            table = model._meta.db_table
+            statements += [
+                schema_editor._create_like_index_sql(model, field),
+                # The admin searches names with istartswith, which
+                # PostgreSQL runs as UPPER(name::text) LIKE 'PREFIX%'. The
+                # *_like index only serves the case-sensitive form.
+                f"CREATE INDEX {table}_name_upper_like "
+                f"ON {table} (UPPER(name::text) text_pattern_ops)",
+            ]
+            statements = [concurrently(sql) for sql in statements]
+        for statement in statements:
+            schema_editor.execute(statement)
+
+
+def drop_name_indexes(apps, schema_editor):
+    for model_name in MODELS:
+        model = apps.get_model("food", model_name)
+        names = schema_editor._constraint_names(model, index=True)
+        for name in names:
+            if name.startswith(f"{model._meta.db_table}_name_"):
+                schema_editor.execute(
+                    schema_editor._delete_index_sql(model, name)
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("food", "0002_cuisine_banner"),
+    ]
+
+    atomic = False
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name=model_name,
+                    name="name",
+                    field=models.CharField(db_index=True, max_length=30),
+                )
+                for model_name in MODELS
+            ],
+            database_operations=[
+                migrations.RunPython(create_name_indexes, drop_name_indexes),
+            ],
+        ),
+    ]
@@ -2,7 +2,7 @@ from django.db import models
 
 
 class Ingredient(models.Model):
-    name = models.CharField(max_length=30)
+    name = models.CharField(max_length=30, db_index=True)
     origin = models.CharField(max_length=30)
 
     def __str__(self) -> str:
@@ -10,7 +10,7 @@ class Ingredient(models.Model):
 
 
 class Cuisine(models.Model):
-    name = models.CharField(max_length=30)
+    name = models.CharField(max_length=30, db_index=True)
     banner = models.ImageField(null=True, blank=True)
 
     def __str__(self) -> str:
@@ -18,7 +18,7 @@ class Cuisine(models.Model):
 
 
 class Recipe(models.Model):
-    name = models.CharField(max_length=30)
+    name = models.CharField(max_length=30, db_index=True)
     steps = models.TextField()
     ingredients = models.ManyToManyField(Ingredient, related_name="recipes")
     cuisine = models.ForeignKey(
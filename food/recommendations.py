@@ -0,0 +1,532 @@
+import fcntl
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from itertools import chain
+from typing import Any, Union
+
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+
+from food.models import Recipe
+from food.utils import on_commit_if_loaded
+
+
+METRICS = ("jaccard", "cosine")
+SNAPSHOT_ARRAYS = ("recipe_ids", "ingredient_ids", "indptr", "indices", "data")
+# Name of the file pointing at the snapshot directory in use.
+CURRENT = "CURRENT"
+# Name of the file locked while a snapshot is built and saved.
+LOCK = "build.lock"
+# Times a worker re-reads CURRENT when the snapshot it names was pruned
+# before it could be opened.
+LOAD_ATTEMPTS = 3
+
+
+def _score(
+    overlap: np.ndarray, sizes: np.ndarray, query_size: int, metric: str
+) -> np.ndarray:
+    overlap = overlap.astype(np.float64)
+    if metric == "cosine":
+        return overlap / np.sqrt(sizes * float(query_size))
+    return overlap / (sizes + query_size - overlap)
+
+
+class SimilarityIndex:
+    """
+    Ranks recipes by the ingredients they share, using a sparse binary
+    recipe x ingredient matrix whose rows and columns follow the sorted
+    ``recipe_ids`` and ``ingredient_ids``.
+
+    Ingredient sets changed after the matrix was built are kept as
+    per-recipe overrides, scored separately, and folded into a new matrix
+    once there are ``compact_after`` of them.
+    """
+
+    def __init__(
+        self,
+        recipe_ids: np.ndarray,
+        ingredient_ids: np.ndarray,
+        matrix: sparse.csr_matrix,
+        built_at: Union[float, None] = None,
+        snapshot: Union[str, None] = None,
+        compact_after: int = 1000,
+    ) -> None:
+        self.recipe_ids = recipe_ids
+        self.ingredient_ids = ingredient_ids
+        self.matrix = matrix
+        self.sizes = np.diff(matrix.indptr)
+        self.built_at = time.time() if built_at is None else built_at
+        self.snapshot = snapshot
+        self.compact_after = compact_after
+        self.overrides: dict[int, frozenset[int]] = {}
+        # Every change applied since the matrix was built from the database,
+        # with the time it was made, to replay them over a newer snapshot.
+        self.changes: dict[int, tuple[float, frozenset[int]]] = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_pairs(cls, pairs: np.ndarray, **kwargs: Any) -> "SimilarityIndex":
+        """Build from an ``(n, 2)`` array of recipe and ingredient ids."""
+        recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        ingredient_ids, cols = np.unique(pairs[:, 1], return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.float32), (rows, cols)),
+            shape=(len(recipe_ids), len(ingredient_ids)),
+        )
+        matrix.data[:] = 1
+        return cls(recipe_ids, ingredient_ids, matrix, **kwargs)
+
+    @classmethod
+    def build(
+        cls, using: str = "default", chunk_size: int = 10000, **kwargs: Any
+    ) -> "SimilarityIndex":
+        """Stream the recipe/ingredient through table into a new index."""
+        kwargs.setdefault("built_at", time.time())
+        links = (
+            Recipe.ingredients.through.objects.using(using)
+            .values_list("recipe_id", "ingredient_id")
+            .iterator(chunk_size=chunk_size)
+        )
+        pairs = np.fromiter(chain.from_iterable(links), dtype=np.int64)
+        return cls.from_pairs(pairs.reshape(-1, 2), **kwargs)
+
+    @classmethod
+    def load(
+        cls, directory: str, snapshot: str, **kwargs: Any
+    ) -> "SimilarityIndex":
+        """
+        Open ``snapshot`` of ``directory`` with its arrays memory-mapped, so
+        every process loading it shares the same pages.
+        """
+        path = os.path.join(directory, snapshot)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in SNAPSHOT_ARRAYS
+        }
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+
+        matrix = sparse.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=(len(arrays["recipe_ids"]), len(arrays["ingredient_ids"])),
+            copy=False,
+        )
+        return cls(
+            arrays["recipe_ids"],
+            arrays["ingredient_ids"],
+            matrix,
+            built_at=meta["built_at"],
+            snapshot=snapshot,
+            **kwargs,
+        )
+
+    def save(self, directory: str) -> str:
+        """
+        Write the matrix as ``.npy`` files into a new snapshot of
+        ``directory`` and point ``CURRENT`` at it. Callers hold the lock of
+        ``directory``, see ``publish_snapshot``.
+        """
+        with self._lock:
+            self.compact()
+            arrays = {
+                "recipe_ids": self.recipe_ids,
+                "ingredient_ids": self.ingredient_ids,
+                "indptr": self.matrix.indptr,
+                "indices": self.matrix.indices,
+                "data": self.matrix.data,
+            }
+            built_at = self.built_at
+
+        snapshot = f"snapshot-{built_at:.6f}-{os.getpid()}"
+        path = os.path.join(directory, snapshot)
+        os.makedirs(path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+        with open(os.path.join(path, "meta.json"), "w") as file:
+            json.dump({"built_at": built_at}, file)
+
+        previous = _current_snapshot(directory)
+        tmp = os.path.join(directory, f"{CURRENT}.tmp-{os.getpid()}")
+        with open(tmp, "w") as file:
+            file.write(snapshot)
+        os.replace(tmp, os.path.join(directory, CURRENT))
+        self.snapshot = snapshot
+
+        # The previous snapshot stays for processes that read CURRENT just
+        # before it moved. Older ones are unlinked, processes still mapping
+        # them keep reading their pages until they move on.
+        for entry in os.listdir(directory):
+            if entry.startswith("snapshot-") and entry not in (
+                snapshot,
+                previous,
+            ):
+                shutil.rmtree(os.path.join(directory, entry), True)
+        return snapshot
+
+    def _row(self, recipe_id: int) -> Union[int, None]:
+        row = int(np.searchsorted(self.recipe_ids, recipe_id))
+        if row < len(self.recipe_ids) and self.recipe_ids[row] == recipe_id:
+            return row
+        return None
+
+    def ingredients_of(self, recipe_id: int) -> frozenset[int]:
+        with self._lock:
+            if recipe_id in self.overrides:
+                return self.overrides[recipe_id]
+
+            row = self._row(recipe_id)
+            if row is None:
+                return frozenset()
+            start, end = self.matrix.indptr[row : row + 2]
+            cols = self.matrix.indices[start:end]
+            return frozenset(self.ingredient_ids[cols].tolist())
+
+    def similar(
+        self, recipe_id: int, first: int = 10, metric: str = "jaccard"
+    ) -> list[tuple[int, float]]:
+        """
+        The ``first`` recipes sharing the most ingredients with
+        ``recipe_id`` as ``(recipe id, score)``, best match first.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"unknown similarity metric {metric}")
+
+        with self._lock:
+            query = self.ingredients_of(recipe_id)
+            overrides = dict(self.overrides)
+            recipe_ids = self.recipe_ids
+            ingredient_ids = self.ingredient_ids
+            matrix = self.matrix
+            sizes = self.sizes
+        if not query or first <= 0:
+            return []
+
+        wanted = np.fromiter(query, dtype=np.int64, count=len(query))
+        cols = np.searchsorted(ingredient_ids, wanted)
+        cols = cols[cols < len(ingredient_ids)]
+        cols = cols[np.isin(ingredient_ids[cols], wanted)]
+        vector = np.zeros(len(ingredient_ids), dtype=np.float32)
+        vector[cols] = 1
+
+        overlap = matrix @ vector
+        rows = np.flatnonzero(overlap)
+        # Overridden recipes are scored from their override below.
+        rows = rows[~np.isin(recipe_ids[rows], [recipe_id, *overrides])]
+        ids = recipe_ids[rows]
+        scores = _score(overlap[rows], sizes[rows], len(query), metric)
+
+        others = [
+            (other, len(query & ingredients), len(ingredients))
+            for other, ingredients in overrides.items()
+            if other != recipe_id and query & ingredients
+        ]
+        if others:
+            other_ids, other_overlap, other_sizes = map(np.array, zip(*others))
+            ids = np.concatenate([ids, other_ids])
+            scores = np.concatenate(
+                [
+                    scores,
+                    _score(other_overlap, other_sizes, len(query), metric),
+                ]
+            )
+
+        if len(scores) > first:
+            # Keep everything tied with the first-th best score, so the
+            # final order does not depend on how the partition broke ties.
+            kth = np.partition(scores, len(scores) - first)[-first]
+            keep = scores >= kth
+            ids, scores = ids[keep], scores[keep]
+
+        order = np.lexsort((ids, -scores))[:first]
+        return list(zip(ids[order].tolist(), scores[order].tolist()))
+
+    def set_ingredients(
+        self,
+        recipe_id: int,
+        ingredient_ids: Iterable[int],
+        changed_at: Union[float, None] = None,
+    ) -> None:
+        ingredients = frozenset(ingredient_ids)
+        changed_at = time.time() if changed_at is None else changed_at
+        with self._lock:
+            self.overrides[recipe_id] = ingredients
+            self.changes[recipe_id] = (changed_at, ingredients)
+            if len(self.overrides) >= self.compact_after:
+                self.compact()
+
+    def add_ingredients(
+        self, recipe_id: int, ingredient_ids: Iterable[int]
+    ) -> None:
+        with self._lock:
+            ingredients = self.ingredients_of(recipe_id)
+            self.set_ingredients(recipe_id, ingredients.union(ingredient_ids))
+
+    def remove_ingredients(
+        self, recipe_id: int, ingredient_ids: Union[Iterable[int], None]
+    ) -> None:
+        """Remove ``ingredient_ids`` from a recipe, all of them for None."""
+        with self._lock:
+            ingredients = frozenset()
+            if ingredient_ids is not None:
+                ingredients = self.ingredients_of(recipe_id).difference(
+                    ingredient_ids
+                )
+            self.set_ingredients(recipe_id, ingredients)
+
+    def remove_recipe(self, recipe_id: int) -> None:
+        self.set_ingredients(recipe_id, ())
+
+    def remove_ingredient(self, ingredient_id: int) -> None:
+        with self._lock:
+            col = int(np.searchsorted(self.ingredient_ids, ingredient_id))
+            recipe_ids = [
+                recipe_id
+                for recipe_id, ingredients in self.overrides.items()
+                if ingredient_id in ingredients
+            ]
+            if (
+                col < len(self.ingredient_ids)
+                and self.ingredient_ids[col] == ingredient_id
+            ):
+                rows = np.repeat(np.arange(len(self.recipe_ids)), self.sizes)[
+                    self.matrix.indices == col
+                ]
+                recipe_ids.extend(self.recipe_ids[rows].tolist())
+
+            for recipe_id in recipe_ids:
+                self.remove_ingredients(recipe_id, [ingredient_id])
+
+    def compact(self) -> None:
+        """Rebuild the matrix with the overrides folded in."""
+        with self._lock:
+            if not self.overrides:
+                return
+
+            coo = self.matrix.tocoo()
+            pairs = np.column_stack(
+                (self.recipe_ids[coo.row], self.ingredient_ids[coo.col])
+            )
+            pairs = pairs[~np.isin(pairs[:, 0], list(self.overrides))]
+            changed = np.array(
+                [
+                    (recipe_id, ingredient_id)
+                    for recipe_id, ingredients in self.overrides.items()
+                    for ingredient_id in ingredients
+                ],
+                dtype=np.int64,
+            ).reshape(-1, 2)
+            rebuilt = self.from_pairs(
+                np.concatenate([pairs.astype(np.int64), changed])
+            )
+            self.recipe_ids = rebuilt.recipe_ids
+            self.ingredient_ids = rebuilt.ingredient_ids
+            self.matrix = rebuilt.matrix
+            self.sizes = rebuilt.sizes
+            self.overrides.clear()
+
+    def replay(self, changes: dict[int, tuple[float, frozenset[int]]]) -> None:
+        """
+        Apply the ``changes`` made after this index was built. The older
+        ones are part of it already, so they are dropped.
+        """
+        for recipe_id, (changed_at, ingredients) in changes.items():
+            if changed_at > self.built_at:
+                self.set_ingredients(recipe_id, ingredients, changed_at)
+
+
+_index: Union[SimilarityIndex, None] = None
+_index_lock = threading.Lock()
+# Whether a request of this process is getting the next index, the others
+# keep answering from the current one meanwhile.
+_refreshing = False
+
+
+def _current_snapshot(directory: str) -> Union[str, None]:
+    try:
+        with open(os.path.join(directory, CURRENT)) as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _built_at(directory: str, snapshot: str) -> float:
+    with open(os.path.join(directory, snapshot, "meta.json")) as file:
+        return json.load(file)["built_at"]
+
+
+@contextmanager
+def _snapshot_lock(directory: str, blocking: bool) -> Iterator[bool]:
+    """
+    Hold the lock serializing builds of ``directory`` across processes,
+    yield whether it was acquired.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK), "a") as file:
+        try:
+            fcntl.flock(
+                file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+            )
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def publish_snapshot(
+    directory: str,
+    max_age: float = 0.0,
+    blocking: bool = True,
+    **kwargs: Any,
+) -> Union[str, None]:
+    """
+    Build the index from the database and save it as the current snapshot
+    of ``directory``, unless the current one was built less than
+    ``max_age`` seconds ago. One process builds at a time, the others wait
+    for it, or return ``None`` right away when not ``blocking``. Returns
+    the current snapshot.
+    """
+    with _snapshot_lock(directory, blocking) as locked:
+        if not locked:
+            return None
+
+        snapshot = _current_snapshot(directory)
+        if snapshot:
+            try:
+                age = time.time() - _built_at(directory, snapshot)
+            except FileNotFoundError:
+                age = math.inf
+            if age < max_age:
+                return snapshot
+        return SimilarityIndex.build(**kwargs).save(directory)
+
+
+def _next_index(
+    index: Union[SimilarityIndex, None],
+    directory: str,
+    stale: bool,
+    compact_after: int,
+) -> Union[SimilarityIndex, None]:
+    """
+    The index replacing ``index`` (None on first use), or None to keep it:
+    the current snapshot of ``directory`` when there is a newer one,
+    publishing it first when missing or ``stale``, or else a new build from
+    the database when needed.
+    """
+    if directory:
+        if index is None:
+            publish_snapshot(directory, max_age=math.inf)
+        elif stale:
+            publish_snapshot(
+                directory,
+                max_age=settings.SIMILARITY_REBUILD_AFTER,
+                blocking=False,
+            )
+
+        for _ in range(LOAD_ATTEMPTS):
+            snapshot = _current_snapshot(directory)
+            if snapshot is None:
+                break
+            if index is not None and index.snapshot == snapshot:
+                return None
+            try:
+                return SimilarityIndex.load(
+                    directory, snapshot, compact_after=compact_after
+                )
+            except FileNotFoundError:
+                # Pruned by newer saves since CURRENT was read.
+                continue
+
+    if index is None or stale:
+        return SimilarityIndex.build(compact_after=compact_after)
+    return None
+
+
+def get_similarity_index() -> SimilarityIndex:
+    """
+    The index of this process. With ``SIMILARITY_SNAPSHOT_DIR`` set, it is
+    mapped from the current snapshot (written by the first process needing
+    it, or ``manage.py build_similarity_index``) and follows newer ones,
+    keeping the changes this process made since they were built. Once the
+    index is ``SIMILARITY_REBUILD_AFTER`` seconds old, the next process
+    asking for it publishes a new snapshot with the changes of every
+    process, or rebuilds its own index without a directory. Other requests
+    keep using the current index until the new one is swapped in.
+    """
+    global _index, _refreshing  # pylint: disable=global-statement
+    directory = settings.SIMILARITY_SNAPSHOT_DIR
+    compact_after = settings.SIMILARITY_COMPACT_AFTER
+    rebuild_after = settings.SIMILARITY_REBUILD_AFTER
+    with _index_lock:
+        if _index is None:
+            # Nothing to answer from yet, requests wait for the first one.
+            _index = _next_index(None, directory, False, compact_after)
+            return _index
+
+        index = _index
+        stale = bool(rebuild_after) and (
+            time.time() - index.built_at > rebuild_after
+        )
+        if _refreshing or not (directory or stale):
+            return index
+        _refreshing = True
+
+    new = None
+    try:
+        new = _next_index(index, directory, stale, compact_after)
+    finally:
+        with _index_lock:
+            _refreshing = False
+            if new is not None:
+                # With the changes made while it was built or loaded.
+                new.replay(_index.changes)
+                _index = new
+            index = _index
+    return index
+
+
+def is_loaded() -> bool:
+    return _index is not None
+
+
+def ingredients_changed(
+    action: str,
+    recipe_ids: Iterable[int],
+    ingredient_ids: Union[Iterable[int], None],
+) -> None:
+    """
+    Apply an ``add`` or ``remove`` of recipe ingredients (``None`` removing
+    all of them) to the index of this process once the transaction commits.
+    """
+    recipe_ids = list(recipe_ids)
+    ingredient_ids = None if ingredient_ids is None else list(ingredient_ids)
+
+    def change(index: SimilarityIndex) -> None:
+        for recipe_id in recipe_ids:
+            if action == "add":
+                index.add_ingredients(recipe_id, ingredient_ids or ())
+            else:
+                index.remove_ingredients(recipe_id, ingredient_ids)
+
+    on_commit_if_loaded(lambda: _index, change)
+
+
+def recipe_deleted(recipe_id: int) -> None:
+    on_commit_if_loaded(
+        lambda: _index, lambda index: index.remove_recipe(recipe_id)
+    )
+
+
+def ingredient_deleted(ingredient_id: int) -> None:
+    on_commit_if_loaded(
+        lambda: _index, lambda index: index.remove_ingredient(ingredient_id)
+    )
@@ -1,8 +1,11 @@
 from .mutations import FoodMutation
 from .queries import FoodQuery
+from .subscriptions import SUBSCRIPTION_GROUPS, FoodSubscription
 
 
 __all__ = [
     "FoodMutation",
     "FoodQuery",
+    "FoodSubscription",
+    "SUBSCRIPTION_GROUPS",
 ]
@@ -5,6 +5,8 @@ from django.db.utils import IntegrityError
 from graphene_file_upload.scalars import Upload
 from graphql import GraphQLError
 
+from food import events
+from food.loaders import get_object_cache
 from food.models import Cuisine, Ingredient, Recipe
 from food.schemas.types import (
     CuisineInputType,
@@ -49,6 +51,7 @@ class UpdateIngredient(graphene.Mutation):
             setattr(ingredient, attr, value)
 
         ingredient.save()
+        get_object_cache(info).prime(ingredient)
 
         return UpdateIngredient(ingredient=ingredient)
 
@@ -67,6 +70,7 @@ class DeleteIngredient(graphene.Mutation):
         except Ingredient.DoesNotExist:
             return DeleteIngredient(status=False)
 
+        get_object_cache(info).discard(Ingredient, ingredient.pk)
         ingredient.delete()
         return DeleteIngredient(status=True)
 
@@ -82,6 +86,7 @@ class CreateCuisine(graphene.Mutation):
         root, info: graphene.ResolveInfo, **kwargs: Any
     ) -> "CreateCuisine":
         cuisine = Cuisine.objects.create(**kwargs)
+        events.cuisine_changed("created", cuisine.id)
         return CreateCuisine(cuisine=cuisine)
 
 
@@ -105,6 +110,8 @@ class UpdateCuisine(graphene.Mutation):
             setattr(cuisine, attr, value)
 
         cuisine.save()
+        get_object_cache(info).prime(cuisine)
+        events.cuisine_changed("updated", cuisine.id)
 
         return UpdateCuisine(cuisine=cuisine)
 
@@ -123,6 +130,11 @@ class DeleteCuisine(graphene.Mutation):
         except Cuisine.DoesNotExist:
             return DeleteCuisine(status=False)
 
+        get_object_cache(info).discard(Cuisine, cuisine.pk)
+        events.cuisine_changed("deleted", cuisine.pk)
+        # The delete cascades to the cuisine's recipes.
+        for recipe_id in cuisine.recipes.values_list("id", flat=True):
+            events.recipe_changed("deleted", recipe_id, cuisine.pk)
         cuisine.delete()
         return DeleteCuisine(status=True)
 
@@ -177,6 +189,7 @@ class CreateRecipe(graphene.Mutation):
 
         recipe = Recipe.objects.create(cuisine=cuisine_db, **kwargs)
         recipe.ingredients.add(*ingredients_db)
+        events.recipe_changed("created", recipe.id, recipe.cuisine_id)
 
         return CreateRecipe(recipe=recipe)
 
@@ -201,13 +214,23 @@ class UpdateRecipe(graphene.Mutation):
         except Recipe.DoesNotExist:
             raise GraphQLError("could not find recipe")
 
+        if "cuisine" in kwargs:
+            kwargs["cuisine_id"] = kwargs.pop("cuisine")
+
+        previous_cuisine_id = recipe.cuisine_id
         for attr, value in kwargs.items():
             setattr(recipe, attr, value)
 
+        recipe.save()
+
         if ingredients:
             recipe.ingredients.clear()
             recipe.ingredients.add(*ingredients)
 
+        events.recipe_changed(
+            "updated", recipe.id, recipe.cuisine_id, previous_cuisine_id
+        )
+
         return UpdateRecipe(recipe=recipe)
 
 
@@ -225,6 +248,7 @@ class DeleteRecipe(graphene.Mutation):
         except Recipe.DoesNotExist:
             return DeleteRecipe(status=False)
 
+        events.recipe_changed("deleted", recipe.id, recipe.cuisine_id)
         recipe.delete()
         return DeleteRecipe(status=True)
 
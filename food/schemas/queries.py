@@ -5,9 +5,17 @@ import graphene_django
 from django.db.models import QuerySet
 from graphql import GraphQLError
 
+from food.autocomplete import autocomplete
+from food.loaders import get_object_cache
 from food.models import Cuisine, Ingredient, Recipe
-from food.schemas.types import CuisineType, IngredientType, RecipeType
-from food.utils import get_case_insensitive_regex
+from food.recommendations import get_similarity_index
+from food.schemas.types import (
+    CuisineType,
+    IngredientType,
+    RecipeType,
+    SimilarityMetric,
+)
+from food.utils import get_case_insensitive_regex, optimize_queryset
 
 
 class FoodQuery(graphene.ObjectType):
@@ -53,6 +61,34 @@ class FoodQuery(graphene.ObjectType):
         recipes=graphene.List(graphene.String),
         ingredients=graphene.List(graphene.String),
     )
+    similar_recipes = graphene.List(
+        graphene.NonNull(RecipeType),
+        recipe_id=graphene.Int(required=True),
+        first=graphene.Int(default_value=10),
+        metric=SimilarityMetric(default_value=SimilarityMetric.JACCARD.value),
+        description=(
+            "Recipes sharing the most ingredients with a recipe, best match "
+            "first"
+        ),
+    )
+
+    # Typeahead
+    autocomplete_ingredients = graphene.List(
+        graphene.NonNull(IngredientType),
+        prefix=graphene.String(required=True),
+        first=graphene.Int(default_value=10),
+        description=(
+            "Ingredients whose name starts with a prefix, the most used first"
+        ),
+    )
+    autocomplete_cuisines = graphene.List(
+        graphene.NonNull(CuisineType),
+        prefix=graphene.String(required=True),
+        first=graphene.Int(default_value=10),
+        description=(
+            "Cuisines whose name starts with a prefix, the most used first"
+        ),
+    )
 
     def resolve_recipe(
         root,
@@ -74,7 +110,7 @@ class FoodQuery(graphene.ObjectType):
         root, info: graphene.ResolveInfo, ingredient_id: int
     ) -> Ingredient:
         try:
-            return Ingredient.objects.get(id=ingredient_id)
+            return get_object_cache(info).get(Ingredient, ingredient_id)
         except Ingredient.DoesNotExist as exc:
             raise GraphQLError(str(exc))
 
@@ -82,13 +118,13 @@ class FoodQuery(graphene.ObjectType):
         root, info: graphene.ResolveInfo, cuisine_id: int
     ) -> Cuisine:
         try:
-            return Cuisine.objects.get(id=cuisine_id)
+            return get_object_cache(info).get(Cuisine, cuisine_id)
         except Cuisine.DoesNotExist as exc:
             raise GraphQLError(str(exc))
 
     def resolve_recipes(
         root,
-        *info: graphene.ResolveInfo,
+        info: graphene.ResolveInfo,
         offset: Union[int, None] = None,
         limit: Union[int, None] = None,
         name: Union[str, None] = None,
@@ -104,12 +140,12 @@ class FoodQuery(graphene.ObjectType):
             pat = get_case_insensitive_regex(ingredients)
             q.update(ingredients__name__iregex=pat)
 
-        query = Recipe.objects.filter(**q)
+        query = optimize_queryset(Recipe.objects.filter(**q), info)
         return query[slice(offset, limit)]
 
     def resolve_ingredients(
         root,
-        *info: graphene.ResolveInfo,
+        info: graphene.ResolveInfo,
         offset: Union[int, None] = None,
         limit: Union[int, None] = None,
         name: Union[str, None] = None,
@@ -125,12 +161,12 @@ class FoodQuery(graphene.ObjectType):
             pat = get_case_insensitive_regex(used_in)
             q.update(recipes__cuisine__name__iregex=pat)
 
-        query = Ingredient.objects.filter(**q)
+        query = optimize_queryset(Ingredient.objects.filter(**q), info)
         return query[slice(offset, limit)]
 
     def resolve_cuisines(
         root,
-        *info: graphene.ResolveInfo,
+        info: graphene.ResolveInfo,
         offset: Union[int, None] = None,
         limit: Union[int, None] = None,
         name: Union[str, None] = None,
@@ -147,5 +183,36 @@ class FoodQuery(graphene.ObjectType):
             pat = get_case_insensitive_regex(ingredients)
             q.update(ingredients__name__iregex=pat)
 
-        query = Cuisine.objects.filter(**q)
+        query = optimize_queryset(Cuisine.objects.filter(**q), info)
         return query[slice(offset, limit)]
+
+    def resolve_similar_recipes(
+        root,
+        info: graphene.ResolveInfo,
+        recipe_id: int,
+        first: int = 10,
+        metric: str = "jaccard",
+    ) -> list[Recipe]:
+        if first < 0:
+            raise GraphQLError("first cannot be negative")
+
+        ranked = get_similarity_index().similar(recipe_id, first, metric)
+        query = optimize_queryset(
+            Recipe.objects.filter(id__in=[pk for pk, _ in ranked]), info
+        )
+        recipes = {recipe.id: recipe for recipe in query}
+        return [recipes[pk] for pk, _ in ranked if pk in recipes]
+
+    def resolve_autocomplete_ingredients(
+        root, info: graphene.ResolveInfo, prefix: str, first: int = 10
+    ) -> list[Ingredient]:
+        if first < 0:
+            raise GraphQLError("first cannot be negative")
+        return autocomplete(Ingredient, prefix, first)
+
+    def resolve_autocomplete_cuisines(
+        root, info: graphene.ResolveInfo, prefix: str, first: int = 10
+    ) -> list[Cuisine]:
+        if first < 0:
+            raise GraphQLError("first cannot be negative")
+        return autocomplete(Cuisine, prefix, first)
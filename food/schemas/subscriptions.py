@@ -0,0 +1,69 @@
+from typing import Any, Union
+
+import graphene
+from rx import Observable
+
+from food.events import Message, cuisine_group, recipe_group
+from food.models import Cuisine, Recipe
+from food.schemas.types import CuisineType, RecipeType
+
+
+class ChangeKind(graphene.Enum):
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+
+
+class RecipeChangedEvent(graphene.ObjectType):
+    kind = graphene.Field(ChangeKind)
+    recipe_id = graphene.Int()
+    cuisine_id = graphene.Int()
+    recipe = graphene.Field(RecipeType, description="Null once deleted")
+
+    def resolve_recipe(
+        root: Message, info: graphene.ResolveInfo
+    ) -> Union[Recipe, None]:
+        return Recipe.objects.filter(id=root["recipe_id"]).first()
+
+
+class CuisineChangedEvent(graphene.ObjectType):
+    kind = graphene.Field(ChangeKind)
+    cuisine_id = graphene.Int()
+    cuisine = graphene.Field(CuisineType, description="Null once deleted")
+
+    def resolve_cuisine(
+        root: Message, info: graphene.ResolveInfo
+    ) -> Union[Cuisine, None]:
+        return Cuisine.objects.filter(id=root["cuisine_id"]).first()
+
+
+class FoodSubscription(graphene.ObjectType):
+    """
+    Each event published by the mutations is executed against the
+    subscription document as its root value. Filtering by cuisine happens
+    when subscribing to the channel layer, see ``SUBSCRIPTION_GROUPS``.
+    """
+
+    recipe_changed = graphene.Field(
+        RecipeChangedEvent, cuisine_id=graphene.Int()
+    )
+    cuisine_changed = graphene.Field(
+        CuisineChangedEvent, cuisine_id=graphene.Int()
+    )
+
+    def resolve_recipe_changed(
+        root: Message, info: graphene.ResolveInfo, **kwargs: Any
+    ) -> Observable:
+        return Observable.of(root)
+
+    def resolve_cuisine_changed(
+        root: Message, info: graphene.ResolveInfo, **kwargs: Any
+    ) -> Observable:
+        return Observable.of(root)
+
+
+# Channel layer group of each subscription field, from its arguments.
+SUBSCRIPTION_GROUPS = {
+    "recipeChanged": recipe_group,
+    "cuisineChanged": cuisine_group,
+}
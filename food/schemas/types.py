@@ -3,6 +3,7 @@ from typing import Union
 import graphene
 import graphene_django
 
+from food.loaders import get_object_cache
 from food.models import Cuisine, Ingredient, Recipe
 from food.utils import build_absolute_uri
 
@@ -24,6 +25,19 @@ class RecipeType(graphene_django.DjangoObjectType):
     class Meta:
         model = Recipe
 
+    def resolve_cuisine(root, info: graphene.ResolveInfo) -> Cuisine:
+        cache = get_object_cache(info)
+        if Recipe.cuisine.is_cached(root):
+            cache.prime(root.cuisine)
+            return root.cuisine
+
+        return cache.get(Cuisine, root.cuisine_id)
+
+
+class SimilarityMetric(graphene.Enum):
+    JACCARD = "jaccard"
+    COSINE = "cosine"
+
 
 class IngredientInputType(graphene.InputObjectType):
     id = graphene.Int()
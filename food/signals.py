@@ -0,0 +1,179 @@
+from typing import Any
+
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from food import autocomplete, cache, recommendations
+from food.models import Cuisine, Ingredient, Recipe
+from food.storage import release_blob
+
+
+def banner_refs(name: str) -> int:
+    return Cuisine.objects.filter(banner=name).count()
+
+
+def release_banner(name: str) -> None:
+    # Counted once committed: a rolled back change keeps its blob, and rows
+    # written meanwhile by uploads reusing the blob are counted. Uploads not
+    # committed yet touched the blob, the storage keeps it for them.
+    transaction.on_commit(lambda: release_blob(name, banner_refs(name)))
+
+
+@receiver(pre_save, sender=Cuisine)
+def remember_previous_banner(
+    sender: type[Cuisine], instance: Cuisine, **kwargs: Any
+) -> None:
+    instance._previous_banner = (
+        Cuisine.objects.filter(pk=instance.pk)
+        .values_list("banner", flat=True)
+        .first()
+        if instance.pk
+        else None
+    )
+
+
+@receiver(post_save, sender=Cuisine)
+def release_replaced_banner(
+    sender: type[Cuisine], instance: Cuisine, **kwargs: Any
+) -> None:
+    previous = getattr(instance, "_previous_banner", None)
+    if previous and previous != instance.banner.name:
+        release_banner(previous)
+
+
+@receiver(post_delete, sender=Cuisine)
+def release_deleted_banner(
+    sender: type[Cuisine], instance: Cuisine, **kwargs: Any
+) -> None:
+    if instance.banner:
+        release_banner(instance.banner.name)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def remember_cleared_links(
+    sender: type[Any], instance: Any, action: str, reverse: bool, **kwargs: Any
+) -> None:
+    # The other ends of the links are gone once they are cleared. Read even
+    # without an index loaded here, the usage counts of other processes
+    # follow the changes of this one.
+    if action == "pre_clear":
+        related = instance.recipes if reverse else instance.ingredients
+        instance._cleared_pks = list(related.values_list("id", flat=True))
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_similarity_index(
+    sender: type[Any],
+    instance: Any,
+    action: str,
+    reverse: bool,
+    pk_set: Any,
+    **kwargs: Any,
+) -> None:
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    change = "add" if action == "post_add" else "remove"
+    if not reverse:
+        recommendations.ingredients_changed(change, [instance.pk], pk_set)
+        return
+
+    recipe_ids = (
+        pk_set if pk_set is not None else getattr(instance, "_cleared_pks", [])
+    )
+    recommendations.ingredients_changed(change, recipe_ids, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_ingredient_usage(
+    sender: type[Any],
+    instance: Any,
+    action: str,
+    reverse: bool,
+    pk_set: Any,
+    using: str,
+    **kwargs: Any,
+) -> None:
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    delta = 1 if action == "post_add" else -1
+    pks = (
+        pk_set if pk_set is not None else getattr(instance, "_cleared_pks", [])
+    )
+    if reverse:
+        autocomplete.used(Ingredient, [instance.pk], delta * len(pks), using)
+    else:
+        autocomplete.used(Ingredient, pks, delta, using)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_previous_cuisine(
+    sender: type[Recipe], instance: Recipe, **kwargs: Any
+) -> None:
+    instance._previous_cuisine_id = (
+        Recipe.objects.filter(pk=instance.pk)
+        .values_list("cuisine_id", flat=True)
+        .first()
+        if instance.pk
+        else None
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def update_cuisine_usage(
+    sender: type[Recipe], instance: Recipe, created: bool, **kwargs: Any
+) -> None:
+    previous = getattr(instance, "_previous_cuisine_id", None)
+    if created:
+        autocomplete.used(Cuisine, [instance.cuisine_id])
+    elif previous is not None and previous != instance.cuisine_id:
+        autocomplete.used(Cuisine, [previous], -1)
+        autocomplete.used(Cuisine, [instance.cuisine_id])
+
+
+@receiver(post_delete, sender=Recipe)
+def drop_deleted_recipe(
+    sender: type[Recipe], instance: Recipe, using: str, **kwargs: Any
+) -> None:
+    recommendations.recipe_deleted(instance.pk)
+    autocomplete.used(Cuisine, [instance.cuisine_id], -1, using)
+    # Deleting a recipe removes its links without sending m2m_changed.
+    autocomplete.recount(Ingredient, using)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Cuisine)
+def index_saved_name(sender: type[Any], instance: Any, **kwargs: Any) -> None:
+    autocomplete.saved(instance)
+
+
+@receiver(post_delete, sender=Ingredient)
+def drop_deleted_ingredient(
+    sender: type[Ingredient], instance: Ingredient, **kwargs: Any
+) -> None:
+    recommendations.ingredient_deleted(instance.pk)
+    autocomplete.deleted(Ingredient, instance.pk)
+
+
+@receiver(post_delete, sender=Cuisine)
+def drop_deleted_cuisine(
+    sender: type[Cuisine], instance: Cuisine, **kwargs: Any
+) -> None:
+    autocomplete.deleted(Cuisine, instance.pk)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Cuisine)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Cuisine)
+def invalidate_cached_entity(
+    sender: type[Any], instance: Any, **kwargs: Any
+) -> None:
+    cache.invalidate(sender, instance.pk)
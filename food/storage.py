@@ -0,0 +1,202 @@
+import fcntl
+import hashlib
+import os
+import re
+import tempfile
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Union
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, default_storage
+
+from food.uploadhandler import (
+    IMAGE_EXTENSIONS,
+    SIGNATURE_LENGTH,
+    sniff_image_type,
+)
+
+
+BLOB_NAME_RE = re.compile(
+    r"^(?P<a>[0-9a-f]{2})/(?P<b>[0-9a-f]{2})/"
+    r"(?P<digest>(?P=a)(?P=b)[0-9a-f]{60})(?P<ext>\.[a-z0-9]+)?$"
+)
+STAGING_DIR = ".incoming"
+LOCK_DIR = ".locks"
+
+
+def blob_name(digest: str, ext: str = "") -> str:
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}"
+
+
+def blob_digest(name: Union[str, None]) -> Union[str, None]:
+    """Return the sha256 of a content-addressed blob name, if it is one."""
+    match = BLOB_NAME_RE.match(name or "")
+    return match.group("digest") if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file under the sha256 of its content
+    (``ab/cd/abcd...<ext>``), so identical uploads share one blob on disk and
+    saving a duplicate only returns the existing name. The extension follows
+    the image type sniffed from the content, the name given by the client is
+    ignored, anything that is not a known image gets none.
+
+    Uploads coming from ``food.uploadhandler.ContentHashUploadHandler``
+    already carry their digest and a temporary file, which is renamed into
+    place without being read again. Anything else is hashed while it is
+    streamed into a staging file next to the blobs.
+
+    Blobs are shared, so they are only removed through ``release`` once
+    nothing references them anymore (see ``food.signals``). Reusing a blob
+    touches it, and ``release`` leaves blobs touched in the last
+    ``BLOB_RELEASE_GRACE`` seconds alone: the row of an upload reusing it
+    may not be committed yet. ``manage.py sweep_blobs`` removes those later.
+    """
+
+    def get_available_name(
+        self, name: str, max_length: Union[int, None] = None
+    ) -> str:
+        # The final name is derived from the content in ``_save``, a taken
+        # name is never a conflict here.
+        return name
+
+    def _save(self, name: str, content: File) -> str:
+        digest: Union[str, None] = getattr(content, "sha256", None)
+        image_type: Union[str, None] = getattr(content, "image_type", None)
+
+        if digest is not None and image_type is not None:
+            existing = blob_name(digest, IMAGE_EXTENSIONS[image_type])
+            if self._reuse(existing, digest):
+                return existing
+
+        staged, digest = self._stage(content, digest)
+        try:
+            if image_type is None:
+                with open(staged, "rb") as file:
+                    image_type = sniff_image_type(file.read(SIGNATURE_LENGTH))
+            name = blob_name(
+                digest, IMAGE_EXTENSIONS.get(image_type or "", "")
+            )
+            if self._reuse(name, digest):
+                os.remove(staged)
+                return name
+
+            full_path = self.path(name)
+            self._makedirs(os.path.dirname(full_path))
+            # Identical names mean identical bytes, so losing a race against
+            # a concurrent upload of the same content is harmless.
+            os.replace(staged, full_path)
+        except BaseException:
+            if os.path.exists(staged):
+                os.remove(staged)
+            raise
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+        return name
+
+    def _reuse(self, name: str, digest: str) -> bool:
+        """Touch the blob ``name`` if it exists, return whether it does."""
+        with self._locked(digest):
+            try:
+                os.utime(self.path(name))
+            except FileNotFoundError:
+                return False
+        return True
+
+    @contextmanager
+    def _locked(self, digest: str) -> Iterator[None]:
+        """Serialize reusing and releasing the blobs of ``digest``."""
+        lock_dir = self.path(LOCK_DIR)
+        self._makedirs(lock_dir)
+        with open(os.path.join(lock_dir, f"{digest[:2]}.lock"), "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _stage(
+        self, content: File, digest: Union[str, None]
+    ) -> tuple[str, str]:
+        staging_dir = self.path(STAGING_DIR)
+        self._makedirs(staging_dir)
+        fd, staged = tempfile.mkstemp(dir=staging_dir, suffix=".part")
+
+        if digest is not None and hasattr(content, "temporary_file_path"):
+            os.close(fd)
+            file_move_safe(
+                content.temporary_file_path(), staged, allow_overwrite=True
+            )
+            return staged, digest
+
+        sha256 = hashlib.sha256()
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    sha256.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            os.remove(staged)
+            raise
+
+        return staged, sha256.hexdigest()
+
+    def _makedirs(self, directory: str) -> None:
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+
+        old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+        try:
+            os.makedirs(
+                directory, self.directory_permissions_mode, exist_ok=True
+            )
+        finally:
+            os.umask(old_umask)
+
+    def release(self, name: Union[str, None], refs: int) -> bool:
+        """
+        Drop a blob once its reference count reached zero, unless it was
+        reused within the grace period. Returns whether it was deleted.
+        """
+        digest = blob_digest(name)
+        if not name or refs > 0:
+            return False
+        if digest is None:
+            if not self.exists(name):
+                return False
+            self.delete(name)
+            return True
+
+        with self._locked(digest):
+            try:
+                modified = os.path.getmtime(self.path(name))
+            except FileNotFoundError:
+                return False
+            if time.time() - modified < settings.BLOB_RELEASE_GRACE:
+                return False
+            self.delete(name)
+        return True
+
+    def blobs(self) -> Iterator[str]:
+        """Names of all the content-addressed blobs."""
+        for root, dirs, files in os.walk(self.location):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for file in files:
+                name = os.path.relpath(os.path.join(root, file), self.location)
+                name = name.replace(os.sep, "/")
+                if blob_digest(name):
+                    yield name
+
+
+def release_blob(name: Union[str, None], refs: int) -> bool:
+    release = getattr(default_storage, "release", None)
+    return bool(release and release(name, refs))
@@ -1,9 +1,34 @@
 from urllib import response
+import asyncio
+import hashlib
+import io
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.admin.models import DELETION, LogEntry
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.http import HttpResponse
 from typing import Callable
+from unittest.mock import Mock
 import pytest
 import json
-from food.models import Cuisine, Ingredient
+from food import autocomplete, cache, events, recommendations
+from food.admin import EstimatedCountPaginator, RecipeAdmin
+from food.cache import EntityCache
+from food.catalogue import CatalogueLoader, RecipeRow
+from food.events import ChannelLayer, InMemoryChannelLayer, recipe_group
+from food.models import Cuisine, Ingredient, Recipe
+from food.recommendations import get_similarity_index
+from recipes import views
+from recipes.admission import client_key, get_admission_controller
 from functools import partial
 from graphene_django.utils.testing import graphql_query
 from hypothesis import given
@@ -66,4 +91,1267 @@ mutation createIngredient($name: string!, $origin: string!){
     assert "errors" not in content
     data = content["data"]["createIngredient"]
     assert data["status"]
-    print(data,"EEEE")
\ No newline at end of file
+    print(data,"EEEE")
+
+@pytest.mark.django_db
+def test_query_budget_fails_on_memory_overrun(client_query) -> None:
+    tracemalloc.start()
+    try:
+        with pytest.raises(pytest.fail.Exception, match="allocated .* bytes"):
+            client_query("{ cuisines { id } }", max_memory=1)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+    response = client_query("{ cuisines { id } }", max_memory=10**8)
+    assert 0 < response.budget.peak_memory <= 10**8
+    assert not tracemalloc.is_tracing()
+
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+CREATE_CUISINE = """
+mutation createCuisine($name: String!, $banner: Upload) {
+  createCuisine(name: $name, banner: $banner) {
+    cuisine {
+      id
+      banner
+    }
+  }
+}
+"""
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    return tmp_path
+
+
+def upload_banner(client_query, content: bytes, name: str = "banner.png"):
+    return client_query(
+        CREATE_CUISINE,
+        op_name="createCuisine",
+        variables={"name": "foo"},
+        files={"banner": SimpleUploadedFile(name, content)},
+    )
+
+
+@pytest.mark.django_db
+def test_duplicate_banners_share_one_blob(
+    client_query, media_root, settings, django_capture_on_commit_callbacks
+) -> None:
+    settings.BLOB_RELEASE_GRACE = 0
+    first = upload_banner(client_query, PNG, "a.png").json()
+    second = upload_banner(client_query, PNG, "a.PNG.jpeg").json()
+    assert "errors" not in first and "errors" not in second
+
+    cuisines = list(Cuisine.objects.order_by("id"))
+    names = {cuisine.banner.name for cuisine in cuisines}
+    digest = hashlib.sha256(PNG).hexdigest()
+    assert names == {f"{digest[:2]}/{digest[2:4]}/{digest}.png"}
+
+    blob = media_root / names.pop()
+    assert blob.read_bytes() == PNG
+
+    with django_capture_on_commit_callbacks(execute=True):
+        cuisines[0].delete()
+    assert blob.exists()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                cuisines[1].delete()
+                raise RuntimeError("rolled back")
+    assert blob.exists()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Cuisine.objects.get().delete()
+    assert not blob.exists()
+
+
+@pytest.mark.django_db
+def test_recently_reused_blobs_wait_for_the_sweeper(
+    client_query, media_root, settings, django_capture_on_commit_callbacks
+) -> None:
+    upload_banner(client_query, PNG)
+    blob = media_root / Cuisine.objects.get().banner.name
+
+    # An upload reusing the blob whose row is not committed yet.
+    assert default_storage.save("b.png", io.BytesIO(PNG)) == str(
+        blob.relative_to(media_root)
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        Cuisine.objects.get().delete()
+    assert blob.exists()
+
+    call_command("sweep_blobs", stdout=io.StringIO())
+    assert blob.exists()
+    settings.BLOB_RELEASE_GRACE = 0
+    call_command("sweep_blobs", stdout=io.StringIO())
+    assert not blob.exists()
+
+
+def test_failed_staging_leaves_no_partial_file(media_root) -> None:
+    class Broken(File):
+        def chunks(self, chunk_size=None):
+            yield b"partial"
+            raise OSError("connection reset")
+
+    with pytest.raises(OSError):
+        default_storage.save("x.png", Broken(io.BytesIO()))
+    assert not list((media_root / ".incoming").iterdir())
+
+
+@pytest.mark.django_db
+def test_banner_blob_extension_follows_sniffed_type(
+    client_query, media_root
+) -> None:
+    content = PNG + b"<script>alert(1)</script>"
+    response = upload_banner(client_query, content, "evil.html")
+
+    assert "errors" not in response.json()
+    digest = hashlib.sha256(content).hexdigest()
+    assert Cuisine.objects.get().banner.name.endswith(f"{digest}.png")
+
+
+@pytest.mark.django_db
+def test_banner_upload_rejects_oversized_and_non_images(
+    client_query, media_root, settings
+) -> None:
+    settings.BANNER_MAX_UPLOAD_SIZE = 32
+
+    response = upload_banner(client_query, PNG)
+    assert response.status_code == 413
+
+    settings.BANNER_MAX_UPLOAD_SIZE = 1024
+    response = upload_banner(client_query, b"#!/bin/sh\nrm -rf /\n")
+    assert response.status_code == 400
+    assert "not a supported image" in response.json()["errors"][0]["message"]
+
+    assert not Cuisine.objects.exists()
+
+
+@pytest.fixture
+def banner_url(client_query, media_root) -> str:
+    upload_banner(client_query, PNG)
+    return Cuisine.objects.get().banner.url
+
+
+@pytest.mark.django_db
+def test_serve_banner_with_conditional_and_range_requests(
+    client, banner_url
+) -> None:
+    response = client.get(banner_url)
+    assert response.status_code == 200
+    assert b"".join(response.streaming_content) == PNG
+    assert response["Content-Type"] == "image/png"
+    assert "immutable" in response["Cache-Control"]
+    etag = response["ETag"]
+
+    response = client.get(banner_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    response = client.get(banner_url, HTTP_RANGE="bytes=0-7")
+    assert response.status_code == 206
+    assert response["Content-Range"] == f"bytes 0-7/{len(PNG)}"
+    assert b"".join(response.streaming_content) == PNG[:8]
+
+    response = client.get(banner_url, HTTP_RANGE=f"bytes={len(PNG)}-")
+    assert response.status_code == 416
+
+    assert client.get("/media/.incoming/x.part").status_code == 404
+    assert client.get("/media/../db.sqlite3").status_code == 404
+
+
+@pytest.mark.django_db
+def test_serve_media_only_renders_images_inline(
+    client, client_query, media_root
+) -> None:
+    upload_banner(client_query, PNG + b"<script>alert(1)</script>", "x.html")
+    response = client.get(Cuisine.objects.get().banner.url)
+    assert response["Content-Type"] == "image/png"
+    assert response["X-Content-Type-Options"] == "nosniff"
+    assert "attachment" not in response.get("Content-Disposition", "")
+
+    for name in ("page.html", "logo.svg"):
+        (media_root / name).write_bytes(b"<script>alert(1)</script>")
+        response = client.get(f"/media/{name}")
+        assert response.status_code == 200
+        assert response["Content-Type"] == "application/octet-stream"
+        assert response["Content-Disposition"] == "attachment"
+
+
+@pytest.mark.django_db
+def test_serve_banner_offloads_to_front_proxy(
+    client, banner_url, settings
+) -> None:
+    settings.MEDIA_OFFLOAD_HEADER = "X-Accel-Redirect"
+
+    response = client.get(banner_url)
+    assert response.status_code == 200
+    assert response["X-Accel-Redirect"] == (
+        settings.MEDIA_OFFLOAD_PREFIX + banner_url[len(settings.MEDIA_URL) :]
+    )
+    assert response.content == b""
+
+
+LIST_QUERIES = {
+    "recipes": "{ recipes { name cuisine { name } ingredients { name } } }",
+    "ingredients": "{ ingredients { name recipes { name cuisine { name } } } }",
+    "cuisines": "{ cuisines { name recipes { name ingredients { name } } } }",
+}
+
+
+@pytest.mark.parametrize("field", LIST_QUERIES)
+def test_list_query_count_does_not_grow_with_rows(
+    client_query, seed_catalogue, field: str
+) -> None:
+    seed_catalogue(recipes=10)
+    small = client_query(LIST_QUERIES[field], max_seconds=5)
+    assert "errors" not in small.json()
+
+    seed_catalogue(recipes=1000)
+    large = client_query(
+        LIST_QUERIES[field], max_queries=len(small.budget.queries)
+    )
+    assert len(large.json()["data"][field]) > len(small.json()["data"][field])
+
+
+@pytest.mark.django_db
+def test_query_budget_lists_offending_sql(client_query, cuisine) -> None:
+    with pytest.raises(pytest.fail.Exception) as exc:
+        client_query("{ cuisines { name } }", max_queries=0)
+
+    assert "ran 1 SQL queries, budget is 0" in str(exc.value)
+    assert '1 x SELECT "food_cuisine"."id"' in str(exc.value)
+
+
+CATALOGUE = [
+    {
+        "name": "pizza",
+        "steps": "bake",
+        "cuisine": "Italian",
+        "ingredients": [{"name": "Tomato", "origin": "Peru"}, "Basil"],
+    },
+    {
+        "name": "pasta",
+        "steps": "boil",
+        "cuisine": "Italian",
+        "ingredients": ["Tomato", "Wheat:Levant"],
+    },
+    {"name": "sushi", "steps": "roll", "cuisine": "Japanese"},
+]
+
+
+@pytest.fixture
+def catalogue_file(tmp_path):
+    path = tmp_path / "recipes.ndjson"
+    path.write_text("\n".join(json.dumps(row) for row in CATALOGUE))
+    return path
+
+
+@pytest.mark.django_db
+def test_import_catalogue_dedupes_names(catalogue_file) -> None:
+    Cuisine.objects.create(name="Italian")
+    call_command("import_catalogue", str(catalogue_file), chunk_size=2)
+
+    assert Recipe.objects.count() == 3
+    assert Cuisine.objects.filter(name="Italian").count() == 1
+    assert Ingredient.objects.filter(name="Tomato").get().origin == "Peru"
+    pasta = Recipe.objects.get(name="pasta")
+    assert pasta.cuisine.name == "Italian"
+    assert sorted(pasta.ingredients.values_list("name", flat=True)) == [
+        "Tomato",
+        "Wheat",
+    ]
+
+
+@pytest.mark.django_db
+def test_import_catalogue_without_reserved_ids(
+    catalogue_file, monkeypatch
+) -> None:
+    monkeypatch.setattr(
+        CatalogueLoader, "_reserve_ids", lambda self, model, count: None
+    )
+    Cuisine.objects.create(name="Italian")
+    call_command("import_catalogue", str(catalogue_file), chunk_size=2)
+
+    assert Cuisine.objects.filter(name="Italian").count() == 1
+    pasta = Recipe.objects.get(name="pasta")
+    assert pasta.cuisine.name == "Italian"
+    assert sorted(pasta.ingredients.values_list("name", flat=True)) == [
+        "Tomato",
+        "Wheat",
+    ]
+
+
+@pytest.mark.django_db
+def test_import_catalogue_resumes_from_checkpoint(
+    catalogue_file, tmp_path
+) -> None:
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text(
+        json.dumps({"source": str(catalogue_file), "rows": 2})
+    )
+
+    out = io.StringIO()
+    call_command(
+        "import_catalogue",
+        str(catalogue_file),
+        checkpoint=str(checkpoint),
+        stdout=out,
+    )
+
+    assert list(Recipe.objects.values_list("name", flat=True)) == ["sushi"]
+    assert json.loads(checkpoint.read_text())["rows"] == 3
+    assert "rows/s" in out.getvalue()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("committed", [True, False])
+def test_import_catalogue_resumes_after_pending_chunk(
+    catalogue_file, tmp_path, committed
+) -> None:
+    recipe = Recipe.objects.create(
+        name="pasta", steps="boil", cuisine=Cuisine.objects.create(name="x")
+    )
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text(
+        json.dumps(
+            {
+                "source": str(catalogue_file),
+                "rows": 1,
+                "pending": {
+                    "rows": 2,
+                    "recipe_id": recipe.id if committed else recipe.id + 1,
+                },
+            }
+        )
+    )
+
+    call_command(
+        "import_catalogue",
+        str(catalogue_file),
+        checkpoint=str(checkpoint),
+        stdout=io.StringIO(),
+    )
+
+    names = sorted(Recipe.objects.values_list("name", flat=True))
+    assert names == (
+        ["pasta", "sushi"] if committed else ["pasta", "pasta", "sushi"]
+    )
+    assert json.loads(checkpoint.read_text()) == {
+        "source": str(catalogue_file),
+        "rows": 3,
+    }
+
+
+@pytest.mark.django_db
+def test_import_catalogue_rejects_long_names(tmp_path) -> None:
+    path = tmp_path / "recipes.ndjson"
+    path.write_text(
+        json.dumps({"name": "ok", "cuisine": "x"})
+        + "\n"
+        + json.dumps({"name": "n" * 31, "cuisine": "x"})
+    )
+
+    with pytest.raises(CommandError, match="line 2: recipe name"):
+        call_command("import_catalogue", str(path), stdout=io.StringIO())
+
+
+@pytest.mark.django_db
+def test_export_catalogue_round_trips(catalogue_file, tmp_path) -> None:
+    call_command("import_catalogue", str(catalogue_file))
+    exported = tmp_path / "recipes.csv"
+    call_command("export_catalogue", str(exported), stdout=io.StringIO())
+
+    Recipe.objects.all().delete()
+    call_command("import_catalogue", str(exported), stdout=io.StringIO())
+
+    assert Ingredient.objects.count() == 3
+    pizza = Recipe.objects.get(name="pizza")
+    assert sorted(pizza.ingredients.values_list("name", flat=True)) == [
+        "Basil",
+        "Tomato",
+    ]
+
+
+def post_batch(client, operations):
+    return client.post(
+        "/graphql/", operations, content_type="application/json"
+    )
+
+
+@pytest.mark.django_db
+def test_batch_shares_loaded_objects(
+    client, cuisine, django_assert_num_queries
+) -> None:
+    Recipe.objects.create(name="pizza", steps="bake", cuisine=cuisine)
+    query = f"{{ cuisine(cuisineId: {cuisine.id}) {{ name }} }}"
+
+    with django_assert_num_queries(2):
+        response = post_batch(
+            client,
+            [
+                {"query": query},
+                {"query": "{ recipes { name cuisine { name } } }"},
+                {"query": query, "id": "again"},
+            ],
+        )
+
+    assert response.status_code == 200
+    first, recipes, again = response.json()
+    assert first["data"] == again["data"] == {"cuisine": {"name": "foo"}}
+    assert again["id"] == "again"
+    assert recipes["data"]["recipes"][0]["cuisine"]["name"] == "foo"
+
+
+@pytest.mark.django_db
+def test_batch_runs_queries_concurrently_and_mutations_in_order(
+    client, settings
+) -> None:
+    settings.GRAPHQL_BATCH_MAX_WORKERS = 4
+    greetings = post_batch(
+        client,
+        [{"query": f'{{ greet(name: "{i}") }}'} for i in range(8)],
+    ).json()
+    assert [r["data"]["greet"] for r in greetings] == [
+        f"Hello, {i}!" for i in range(8)
+    ]
+
+    mutation = 'mutation { createCuisine(name: "bar") { cuisine { id } } }'
+    results = post_batch(
+        client,
+        [{"query": mutation}, {"query": "{ cuisines { name } }"}],
+    ).json()
+    assert results[1]["data"]["cuisines"] == [{"name": "bar"}]
+
+    settings.GRAPHQL_BATCH_MAX_SIZE = 1
+    assert post_batch(client, [{"query": mutation}] * 2).status_code == 400
+
+
+@pytest.mark.django_db
+def test_batch_rejects_entries_that_are_not_objects(client) -> None:
+    for batch in ([1], [{"query": "{ cuisines { id } }"}, "x"]):
+        response = post_batch(client, batch)
+        assert response.status_code == 400
+        message = response.json()["errors"][0]["message"]
+        assert "must be JSON objects" in message
+
+
+@pytest.mark.django_db
+def test_batch_threads_take_read_slots(client, settings, monkeypatch) -> None:
+    settings.GRAPHQL_BATCH_MAX_WORKERS = 4
+    settings.ADMISSION_MAX_READS = 3
+    reads = get_admission_controller().queues["read"]
+    assert reads.acquire(0)  # another request holds one of the slots
+    pools = []
+
+    class RecordingPool(ThreadPoolExecutor):
+        def __init__(self, max_workers):
+            pools.append(max_workers)
+            super().__init__(max_workers)
+
+    monkeypatch.setattr(views, "ThreadPoolExecutor", RecordingPool)
+    batch = [{"query": f'{{ greet(name: "{i}") }}'} for i in range(4)]
+    assert post_batch(client, batch).status_code == 200
+    assert pools == [2]
+    assert reads.in_flight == 1
+
+    assert reads.acquire(0)
+    assert post_batch(client, batch).status_code == 200
+    assert pools == [2]  # no slot to spare, run in order
+
+
+def test_subscription_backpressure_drops_oldest_events() -> None:
+    async def run() -> None:
+        layer = InMemoryChannelLayer(max_pending=2)
+        subscription = layer.subscribe(recipe_group())
+        for i in range(5):
+            layer.publish([recipe_group()], {"recipe_id": i})
+        await asyncio.sleep(0)
+
+        received = [(await subscription.__anext__())["recipe_id"]]
+        received.append((await subscription.__anext__())["recipe_id"])
+        assert received == [3, 4]
+        assert subscription.dropped == 3
+
+        subscription.close()
+        assert not layer.groups
+
+    asyncio.run(run())
+
+
+@pytest.mark.django_db(transaction=True)
+def test_websocket_subscription_filters_by_cuisine() -> None:
+    from recipes.schemas import SCHEMA
+    from recipes.subscriptions import GraphQLWebSocketApp
+
+    layer = InMemoryChannelLayer()
+    app = GraphQLWebSocketApp(SCHEMA, layer=layer)
+    scope = {
+        "type": "websocket",
+        "path": "/graphql/",
+        "subprotocols": ["graphql-transport-ws"],
+    }
+
+    async def run() -> None:
+        ws = ApplicationCommunicator(app, scope)
+        await ws.send_input({"type": "websocket.connect"})
+        assert (await ws.receive_output(1))["type"] == "websocket.accept"
+
+        async def exchange(message) -> dict:
+            await ws.send_input(
+                {"type": "websocket.receive", "text": json.dumps(message)}
+            )
+            return json.loads((await ws.receive_output(1))["text"])
+
+        assert (await exchange({"type": "connection_init"})) == {
+            "type": "connection_ack"
+        }
+        await ws.send_input(
+            {
+                "type": "websocket.receive",
+                "text": json.dumps(
+                    {
+                        "id": "1",
+                        "type": "subscribe",
+                        "payload": {
+                            "query": """
+                            subscription($cuisine: Int) {
+                              recipeChanged(cuisineId: $cuisine) {
+                                kind
+                                recipeId
+                              }
+                            }
+                            """,
+                            "variables": {"cuisine": 7},
+                        },
+                    }
+                ),
+            }
+        )
+        while recipe_group(7) not in layer.groups:
+            await asyncio.sleep(0.01)
+
+        for recipe_id, cuisine_id in [(1, 3), (2, 7)]:
+            layer.publish(
+                [recipe_group(), recipe_group(cuisine_id)],
+                {"kind": "created", "recipe_id": recipe_id},
+            )
+
+        message = json.loads((await ws.receive_output(1))["text"])
+        assert message == {
+            "id": "1",
+            "type": "next",
+            "payload": {
+                "data": {"recipeChanged": {"kind": "CREATED", "recipeId": 2}}
+            },
+        }
+
+        await ws.send_input(
+            {
+                "type": "websocket.receive",
+                "text": json.dumps({"id": "1", "type": "complete"}),
+            }
+        )
+        while layer.groups:
+            await asyncio.sleep(0.01)
+        await ws.send_input({"type": "websocket.disconnect"})
+
+    async_to_sync(run)()
+
+
+def test_subscription_group_resolves_fragments() -> None:
+    from graphql import GraphQLError, parse
+    from graphql.utils.get_operation_ast import get_operation_ast
+
+    from recipes.schemas import SCHEMA
+    from recipes.subscriptions import Connection, GraphQLWebSocketApp
+
+    connection = Connection(GraphQLWebSocketApp(SCHEMA), {}, None)
+
+    def group(query: str, variables=None):
+        document = parse(query)
+        operation = get_operation_ast(document)
+        return connection.group(document, operation, variables or {})
+
+    assert (
+        group(
+            """
+            subscription($c: Int) { ...changes }
+            fragment changes on Subscription {
+              ... on Subscription { recipeChanged(cuisineId: $c) { kind } }
+            }
+            """,
+            {"c": 7},
+        )
+        == recipe_group(7)
+    )
+    assert group("query { cuisines { name } }") is None
+
+    for query in (
+        "subscription { recipeChanged { kind } cuisineChanged { kind } }",
+        "subscription { unknown { kind } }",
+    ):
+        with pytest.raises(GraphQLError):
+            group(query)
+
+
+@pytest.mark.django_db
+def test_mutations_publish_change_events(
+    client_query, cuisine, monkeypatch, django_capture_on_commit_callbacks
+) -> None:
+    published = []
+
+    class RecordingLayer(ChannelLayer):
+        def publish(self, groups, message) -> None:
+            published.append((sorted(groups), message))
+
+        def subscribe(self, group):
+            raise AssertionError("not subscribed in this test")
+
+        def unsubscribe(self, subscription) -> None:
+            pass
+
+    monkeypatch.setattr(events, "_layer", RecordingLayer())
+    with django_capture_on_commit_callbacks(execute=True):
+        client_query(
+            f"""
+            mutation {{
+              createRecipe(
+                name: "pizza", steps: "bake", cuisine: {{id: {cuisine.id}}}
+              ) {{ recipe {{ id }} }}
+            }}
+            """
+        )
+
+    recipe = Recipe.objects.get()
+    assert published == [
+        (
+            ["recipes", f"recipes.cuisine.{cuisine.id}"],
+            {
+                "kind": "created",
+                "recipe_id": recipe.id,
+                "cuisine_id": cuisine.id,
+            },
+        )
+    ]
+
+    other = Cuisine.objects.create(name="bar")
+    published.clear()
+    with django_capture_on_commit_callbacks(execute=True):
+        client_query(
+            f"""
+            mutation {{
+              updateRecipe(id: {recipe.id}, cuisine: {other.id}) {{
+                recipe {{ id }}
+              }}
+            }}
+            """
+        )
+
+    assert published == [
+        (
+            sorted(
+                [
+                    "recipes",
+                    f"recipes.cuisine.{cuisine.id}",
+                    f"recipes.cuisine.{other.id}",
+                ]
+            ),
+            {
+                "kind": "updated",
+                "recipe_id": recipe.id,
+                "cuisine_id": other.id,
+            },
+        )
+    ]
+
+    published.clear()
+    with django_capture_on_commit_callbacks(execute=True):
+        client_query(
+            f"mutation {{ deleteCuisine(id: {other.id}) {{ status }} }}"
+        )
+
+    assert (
+        ["recipes", f"recipes.cuisine.{other.id}"],
+        {"kind": "deleted", "recipe_id": recipe.id, "cuisine_id": other.id},
+    ) in published
+    assert not Recipe.objects.exists()
+
+
+@pytest.fixture
+def similar_recipes(db, monkeypatch, settings):
+    """Recipes 0 and 1 share all their ingredients, 2 some, 3 none."""
+    settings.SIMILARITY_SNAPSHOT_DIR = ""
+    monkeypatch.setattr(recommendations, "_index", None)
+    cuisine = Cuisine.objects.create(name="italian")
+    a, b, c, d = (
+        Ingredient.objects.create(name=name, origin="x") for name in "abcd"
+    )
+    recipes = []
+    for ingredients in ([a, b, c], [a, b, c], [a, b], [d]):
+        recipe = Recipe.objects.create(name="r", steps="s", cuisine=cuisine)
+        recipe.ingredients.add(*ingredients)
+        recipes.append(recipe)
+    return recipes
+
+
+SIMILAR_RECIPES = """
+    query similar($id: Int!) {
+      similarRecipes(recipeId: $id, first: 2) { id }
+    }
+"""
+
+
+@pytest.mark.django_db
+def test_similar_recipes_follow_recipe_mutations(
+    client_query, similar_recipes, django_capture_on_commit_callbacks
+) -> None:
+    ids = [recipe.id for recipe in similar_recipes]
+
+    def similar() -> list[int]:
+        response = client_query(
+            SIMILAR_RECIPES, variables={"id": ids[0]}, max_queries=1
+        )
+        content = json.loads(response.content)
+        return [int(r["id"]) for r in content["data"]["similarRecipes"]]
+
+    get_similarity_index()  # the first call reads the through table
+    assert similar() == [ids[1], ids[2]]
+
+    ingredients = list(
+        similar_recipes[0].ingredients.values_list("id", flat=True)
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        client_query(
+            f"""
+            mutation {{
+              updateRecipe(id: {ids[3]}, ingredients: {ingredients}) {{
+                recipe {{ id }}
+              }}
+              deleteRecipe(id: {ids[1]}) {{ status }}
+            }}
+            """
+        )
+
+    assert similar() == [ids[3], ids[2]]
+
+
+@pytest.mark.django_db
+def test_similarity_snapshot_is_shared_and_compacted(
+    similar_recipes, settings, tmp_path
+) -> None:
+    ids = [recipe.id for recipe in similar_recipes]
+    settings.SIMILARITY_SNAPSHOT_DIR = str(tmp_path)
+    call_command("build_similarity_index", stdout=io.StringIO())
+
+    index = get_similarity_index()
+    assert index.snapshot == (tmp_path / "CURRENT").read_text()
+    assert index.matrix.indices.base is not None  # memory-mapped
+    assert index.similar(ids[0], 3, "cosine") == [
+        (ids[1], pytest.approx(1.0)),
+        (ids[2], pytest.approx(2 / 6**0.5)),
+    ]
+
+    index.compact_after = 1
+    index.remove_recipe(ids[1])
+    assert not index.overrides
+    assert index.similar(ids[0], 3) == [(ids[2], pytest.approx(2 / 3))]
+
+
+@pytest.mark.django_db
+def test_similarity_snapshots_are_republished_when_stale(
+    similar_recipes, settings, tmp_path, monkeypatch
+) -> None:
+    settings.SIMILARITY_SNAPSHOT_DIR = str(tmp_path)
+    settings.SIMILARITY_REBUILD_AFTER = 60
+    now = [1000.0]
+    monkeypatch.setattr(recommendations, "time", Mock(time=lambda: now[0]))
+    first = get_similarity_index()
+    now[0] += 30
+    assert get_similarity_index() is first
+
+    now[0] += 60
+    second = get_similarity_index()
+    assert second.snapshot != first.snapshot
+    # Kept for workers that read CURRENT before it moved.
+    assert (tmp_path / first.snapshot).is_dir()
+
+    now[0] += 90
+    third = get_similarity_index()
+    snapshots = sorted(p.name for p in tmp_path.glob("snapshot-*"))
+    assert snapshots == sorted([second.snapshot, third.snapshot])
+
+
+@pytest.mark.django_db
+def test_similarity_index_survives_pruned_snapshot(
+    similar_recipes, settings, tmp_path
+) -> None:
+    ids = [recipe.id for recipe in similar_recipes]
+    settings.SIMILARITY_SNAPSHOT_DIR = str(tmp_path)
+    (tmp_path / "CURRENT").write_text("snapshot-gone")
+
+    index = get_similarity_index()
+    assert index.snapshot == (tmp_path / "CURRENT").read_text()
+    assert index.similar(ids[0], 1) == [(ids[1], pytest.approx(1.0))]
+
+
+@pytest.mark.django_db
+def test_similarity_index_is_rebuilt_when_stale_without_snapshots(
+    similar_recipes, settings, monkeypatch
+) -> None:
+    ids = [recipe.id for recipe in similar_recipes]
+    settings.SIMILARITY_REBUILD_AFTER = 60
+    now = [1000.0]
+    monkeypatch.setattr(recommendations, "time", Mock(time=lambda: now[0]))
+    first = get_similarity_index()
+    # Changed by another worker, uncommitted callbacks never reach this one.
+    similar_recipes[3].ingredients.add(*similar_recipes[0].ingredients.all())
+    first.set_ingredients(ids[2], [], changed_at=now[0] + 10)
+    first.set_ingredients(ids[1], [], changed_at=now[0] + 100)
+    now[0] += 30
+    assert get_similarity_index() is first
+
+    now[0] += 60
+    second = get_similarity_index()
+    assert second is not first
+    assert second.changes == {ids[1]: (now[0] + 10, frozenset())}
+    assert second.similar(ids[0], 1) == [(ids[3], pytest.approx(0.75))]
+
+
+@pytest.mark.django_db
+def test_stale_similarity_index_is_rebuilt_outside_the_lock(
+    similar_recipes, settings, monkeypatch
+) -> None:
+    settings.SIMILARITY_REBUILD_AFTER = 60
+    now = [1000.0]
+    monkeypatch.setattr(recommendations, "time", Mock(time=lambda: now[0]))
+    first = get_similarity_index()
+    build = recommendations.SimilarityIndex.build
+    during = []
+
+    def slow_build(**kwargs):
+        # Another request asking meanwhile gets the current index.
+        during.append(get_similarity_index())
+        return build(**kwargs)
+
+    monkeypatch.setattr(
+        recommendations.SimilarityIndex, "build", slow_build
+    )
+    now[0] += 90
+    second = get_similarity_index()
+    assert during == [first]
+    assert second is not first
+    assert get_similarity_index() is second
+
+
+@pytest.fixture
+def typeahead(db, monkeypatch):
+    """Ingredients used by 2, 1 and 0 recipes, in two cuisines."""
+    monkeypatch.setattr(autocomplete, "_indexes", {})
+    italian = Cuisine.objects.create(name="Italian")
+    Cuisine.objects.create(name="Indian")
+    tomato, tomatillo, _ = (
+        Ingredient.objects.create(name=name, origin="x")
+        for name in ("tomato", "Tomatillo", "tofu")
+    )
+    Recipe.objects.create(
+        name="r", steps="s", cuisine=italian
+    ).ingredients.add(tomato, tomatillo)
+    Recipe.objects.create(
+        name="r", steps="s", cuisine=italian
+    ).ingredients.add(tomato)
+
+
+def autocomplete_names(client_query, field: str, prefix: str) -> list[str]:
+    response = client_query(
+        f'{{ {field}(prefix: "{prefix}", first: 3) {{ name }} }}',
+        max_queries=0,
+    )
+    return [
+        item["name"] for item in json.loads(response.content)["data"][field]
+    ]
+
+
+@pytest.mark.django_db
+def test_autocomplete_ranks_by_usage_without_queries(
+    client_query, typeahead
+) -> None:
+    autocomplete.get_prefix_index(Ingredient)
+    autocomplete.get_prefix_index(Cuisine)
+
+    assert autocomplete_names(
+        client_query, "autocompleteIngredients", "TO"
+    ) == [
+        "tomato",
+        "Tomatillo",
+        "tofu",
+    ]
+    assert autocomplete_names(
+        client_query, "autocompleteIngredients", "tom"
+    ) == [
+        "tomato",
+        "Tomatillo",
+    ]
+    assert autocomplete_names(client_query, "autocompleteCuisines", "i") == [
+        "Italian",
+        "Indian",
+    ]
+
+
+@pytest.mark.django_db
+def test_autocomplete_follows_mutations(
+    client_query, typeahead, django_capture_on_commit_callbacks
+) -> None:
+    autocomplete.get_prefix_index(Ingredient)
+    autocomplete.get_prefix_index(Cuisine)
+    tomato = Ingredient.objects.get(name="tomato")
+    tofu = Ingredient.objects.get(name="tofu")
+    indian = Cuisine.objects.get(name="Indian")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        for _ in range(3):
+            client_query(
+                f"""
+                mutation {{
+                  createRecipe(
+                    name: "r", steps: "s", cuisine: {{id: {indian.id}}},
+                    ingredients: [{{id: {tofu.id}}}]
+                  ) {{ recipe {{ id }} }}
+                }}
+                """
+            )
+        client_query(
+            f"""
+            mutation {{
+              createIngredient(name: "toast", origin: "x") {{
+                ingredient {{ id }}
+              }}
+              deleteIngredient(id: {tomato.id}) {{ status }}
+            }}
+            """
+        )
+
+    assert autocomplete_names(
+        client_query, "autocompleteIngredients", "to"
+    ) == [
+        "tofu",
+        "Tomatillo",
+        "toast",
+    ]
+    assert autocomplete_names(client_query, "autocompleteCuisines", "i") == [
+        "Indian",
+        "Italian",
+    ]
+
+
+@pytest.mark.django_db
+def test_cascaded_recipe_deletes_recount_usage_once(
+    typeahead, django_capture_on_commit_callbacks
+) -> None:
+    index = autocomplete.get_prefix_index(Ingredient)
+    tomato = Ingredient.objects.get(name="tomato")
+    tomatillo = Ingredient.objects.get(name="Tomatillo")
+    italian = Cuisine.objects.get(name="Italian")
+    for _ in range(3):
+        Recipe.objects.create(name="r", steps="s", cuisine=italian)
+
+    with CaptureQueriesContext(connection) as queries:
+        with django_capture_on_commit_callbacks(execute=True):
+            italian.delete()
+
+    recounts = [query for query in queries if "GROUP BY" in query["sql"]]
+    assert len(recounts) == 1
+    assert index.usage[tomato.id] == index.usage[tomatillo.id] == 0
+
+
+@pytest.mark.django_db
+def test_autocomplete_reads_changes_of_other_processes(
+    client_query, typeahead, django_capture_on_commit_callbacks
+) -> None:
+    index = autocomplete.get_prefix_index(Ingredient)
+    with django_capture_on_commit_callbacks(execute=True):
+        ingredients = (("tomato", "x"), ("toffee", "x"))
+        CatalogueLoader().load([RecipeRow("r", "s", "Italian", ingredients)])
+
+    assert autocomplete.get_prefix_index(Ingredient) is not index
+    assert autocomplete_names(
+        client_query, "autocompleteIngredients", "to"
+    ) == [
+        "tomato",
+        "toffee",
+        "Tomatillo",
+    ]
+
+    # Changes made by this process are applied to its own index.
+    index = autocomplete.get_prefix_index(Ingredient)
+    with django_capture_on_commit_callbacks(execute=True):
+        Ingredient.objects.create(name="tonka", origin="z")
+    assert autocomplete.get_prefix_index(Ingredient) is index
+    assert [i.name for i in index.search("ton")] == ["tonka"]
+
+
+@pytest.mark.django_db
+def test_recipe_changelist_queries_do_not_grow_with_rows(
+    admin_client, seed_catalogue
+) -> None:
+    url = reverse("admin:food_recipe_changelist")
+
+    def sql(recipes: int) -> list[str]:
+        seed_catalogue(recipes=recipes)
+        with CaptureQueriesContext(connection) as queries:
+            assert admin_client.get(url).status_code == 200
+        return [query["sql"] for query in queries]
+
+    few, many = sql(5), sql(500)
+    assert len(few) == len(many)
+    counts = [query for query in many if "COUNT(" in query]
+    assert counts and all("LIMIT" in query for query in counts)
+
+
+@pytest.mark.django_db
+def test_estimated_count_paginator_caps_counts(seed_catalogue) -> None:
+    seed_catalogue(recipes=20)
+
+    class Capped(EstimatedCountPaginator):
+        max_count = 8
+
+    assert Capped(Recipe.objects.order_by("id"), 5).count == 8
+    recipes = Recipe.objects.filter(name="recipe 1").order_by("id")
+    assert Capped(recipes, 5).count == 1
+    assert Capped(list(range(20)), 5).count == 20
+
+
+@pytest.mark.django_db
+def test_recipe_change_form_only_renders_selected_ingredients(
+    admin_client, seed_catalogue
+) -> None:
+    ids = seed_catalogue(recipes=1, ingredients=30, ingredients_per_recipe=2)
+    url = reverse("admin:food_recipe_change", args=[ids["recipes"][0]])
+
+    content = admin_client.get(url).content.decode()
+
+    assert "ingredient 1<" in content
+    assert "ingredient 29<" not in content
+
+
+@pytest.mark.django_db
+def test_delete_action_runs_in_chunks(
+    admin_client, seed_catalogue, monkeypatch
+) -> None:
+    ids = seed_catalogue(recipes=7)
+    monkeypatch.setattr(RecipeAdmin, "action_chunk_size", 3)
+
+    url = reverse("admin:food_recipe_changelist")
+    action = {
+        "action": "delete_in_chunks",
+        "select_across": "1",
+        "index": "0",
+        "_selected_action": ids["recipes"][:1],
+    }
+    response = admin_client.post(url, action)
+    assert response.status_code == 200
+    assert "delete 7 recipes?" in response.content.decode()
+    assert Recipe.objects.count() == 7
+
+    with monkeypatch.context() as patch:
+        patch.setattr(EstimatedCountPaginator, "max_count", 5)
+        response = admin_client.post(url, action)
+    assert "delete at least 5 recipes?" in response.content.decode()
+
+    action.pop("index")
+    response = admin_client.post(url, {**action, "post": "yes"}, follow=True)
+
+    assert "Deleted 7 recipes." in response.content.decode()
+    assert not Recipe.objects.exists()
+    assert sorted(
+        LogEntry.objects.filter(action_flag=DELETION).values_list(
+            "object_id", flat=True
+        )
+    ) == sorted(str(pk) for pk in ids["recipes"])
+
+
+@pytest.mark.django_db
+def test_admission_rate_limits_each_client(client, settings) -> None:
+    settings.ADMISSION_RATE = 0.01
+    settings.ADMISSION_BURST = 2
+    query = {"query": "{ cuisines { id } }"}
+
+    statuses = [
+        client.post("/graphql/", query, content_type="application/json")
+        for _ in range(3)
+    ]
+    other = client.post(
+        "/graphql/",
+        query,
+        content_type="application/json",
+        REMOTE_ADDR="10.0.0.2",
+    )
+
+    assert [r.status_code for r in statuses] == [200, 200, 429]
+    assert int(statuses[2]["Retry-After"]) == 100
+    assert statuses[2].json()["errors"][0]["message"] == "Too many requests."
+    assert other.status_code == 200
+    metrics = client.get("/metrics/").content.decode()
+    assert 'graphql_admission_shed_total{reason="rate"} 1' in metrics
+
+    # Limited before the body is parsed to tell queries from mutations.
+    response = client.post(
+        "/graphql/", "{not json", content_type="application/json"
+    )
+    assert response.status_code == 429
+
+
+def test_admission_client_key_ignores_spoofed_forwarded_for(
+    rf, settings
+) -> None:
+    settings.ADMISSION_CLIENT_IP_HEADER = "HTTP_X_FORWARDED_FOR"
+    request = rf.get("/", HTTP_X_FORWARDED_FOR="1.1.1.1, 10.0.0.7, 10.0.0.1")
+
+    assert client_key(request) == "ip:10.0.0.1"
+    settings.ADMISSION_TRUSTED_PROXY_HOPS = 2
+    assert client_key(request) == "ip:10.0.0.7"
+    settings.ADMISSION_TRUSTED_PROXY_HOPS = 5
+    assert client_key(request) == "ip:1.1.1.1"
+
+
+@pytest.mark.django_db
+def test_admission_sheds_writes_separately_from_reads(
+    client, client_query, settings, media_root
+) -> None:
+    settings.ADMISSION_MAX_WRITES = 1
+    settings.ADMISSION_QUEUE_TIMEOUT = 0.01
+    writes = get_admission_controller().queues["write"]
+    assert writes.acquire(0)  # a long mutation holds the only write slot
+
+    mutation = client_query(
+        'mutation { createIngredient(name: "a", origin: "b") { __typename } }'
+    )
+    upload = upload_banner(client_query, PNG)
+    query = client_query("{ cuisines { id } }")
+
+    assert mutation.status_code == upload.status_code == 503
+    assert mutation["Retry-After"] == "1"
+    assert query.status_code == 200
+    assert not Ingredient.objects.exists() and not Cuisine.objects.exists()
+    metrics = client.get("/metrics/").content.decode()
+    shed = 'graphql_admission_shed_total{reason="timeout",queue="write"} 2'
+    assert shed in metrics
+    assert 'graphql_admission_in_flight{queue="write"} 1' in metrics
+    assert 'graphql_admission_admitted_total{queue="read"} 1' in metrics
+
+
+def test_metrics_are_only_served_to_allowed_clients(
+    client, admin_client, settings
+) -> None:
+    assert client.get("/metrics/").status_code == 200
+    outside = {"REMOTE_ADDR": "203.0.113.7"}
+    assert client.get("/metrics/", **outside).status_code == 403
+    assert admin_client.get("/metrics/", **outside).status_code == 200
+
+    settings.METRICS_ALLOWED_IPS = ["203.0.113.0/24"]
+    assert client.get("/metrics/", **outside).status_code == 200
+    assert client.get("/metrics/").status_code == 403
+
+
+@pytest.mark.django_db
+def test_entity_cache_serves_repeated_lookups_until_changed(
+    client, client_query, cuisine, django_capture_on_commit_callbacks
+) -> None:
+    query = f"{{ cuisine(cuisineId: {cuisine.id}) {{ name }} }}"
+    client_query(query, max_queries=1)
+    client_query(query, max_queries=0)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        client_query(
+            f"""
+            mutation {{
+              updateCuisine(id: {cuisine.id}, name: "fusion") {{
+                cuisine {{ id }}
+              }}
+            }}
+            """
+        )
+    response = client_query(query, max_queries=1)
+    assert response.json()["data"]["cuisine"]["name"] == "fusion"
+
+    Cuisine.objects.filter(id=cuisine.id).delete()
+    assert "errors" in client_query(query).json()
+
+    metrics = client.get("/metrics/").content.decode()
+    for result, count in (("local_hit", 1), ("miss", 3)):
+        sample = (
+            "entity_cache_lookups_total"
+            f'{{model="food.Cuisine",result="{result}"}} {count}'
+        )
+        assert sample in metrics
+
+
+@pytest.mark.django_db
+def test_entity_cache_shares_rows_and_stays_bounded(
+    cuisine, django_assert_num_queries
+) -> None:
+    other = Cuisine.objects.create(name="other")
+    first = EntityCache(max_entries=1, shared=caches["default"])
+    second = EntityCache(max_entries=1, shared=caches["default"])
+
+    with django_assert_num_queries(1):
+        loaded = first.get_many(Cuisine, [cuisine.id, other.id])
+    with django_assert_num_queries(0):
+        shared = second.get_many(Cuisine, [cuisine.id, other.id])
+
+    assert {pk: c.name for pk, c in shared.items()} == {
+        pk: c.name for pk, c in loaded.items()
+    }
+    assert shared[cuisine.id] is not loaded[cuisine.id]
+    assert len(first) == len(second) == 1
+    assert second.stats == {("food.Cuisine", "shared_hit"): 2}
+
+    second.invalidate(Cuisine, cuisine.id)
+    with django_assert_num_queries(1):
+        first.get_many(Cuisine, [cuisine.id])
+    caches["default"].clear()
+
+
+@pytest.mark.django_db
+def test_entity_cache_drops_rows_changed_during_a_lookup(
+    cuisine, django_assert_num_queries
+) -> None:
+    class Racing(EntityCache):
+        raced = False
+
+        def _store(self, model, rows, since, generations=None):
+            # Changed and invalidated after the row was read.
+            if generations is not None and not self.raced:
+                self.raced = True
+                Cuisine.objects.filter(id=cuisine.id).update(name="changed")
+                self.invalidate(Cuisine, cuisine.id)
+            super()._store(model, rows, since, generations)
+
+    racing = Racing(shared=caches["default"])
+    assert racing.get_many(Cuisine, [cuisine.id])[cuisine.id].name == "foo"
+
+    for lookup in (EntityCache(shared=caches["default"]), racing):
+        with django_assert_num_queries(1):
+            loaded = lookup.get_many(Cuisine, [cuisine.id])
+        assert loaded[cuisine.id].name == "changed"
+        caches["default"].clear()
+
+
+@pytest.mark.django_db
+def test_entity_cache_ignores_rows_cached_with_other_columns(
+    cuisine, django_assert_num_queries, monkeypatch
+) -> None:
+    with monkeypatch.context() as patch:
+        patch.setattr(cache, "_columns", lambda model: ["id", "name"])
+        EntityCache(shared=caches["default"]).get_many(Cuisine, [cuisine.id])
+
+    with django_assert_num_queries(1):
+        loaded = EntityCache(shared=caches["default"]).get_many(
+            Cuisine, [cuisine.id]
+        )
+    assert loaded[cuisine.id].name == cuisine.name
+    caches["default"].clear()
@@ -0,0 +1,108 @@
+import hashlib
+from typing import Any, Union
+
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+IMAGE_SIGNATURES: dict[bytes, str] = {
+    b"\x89PNG\r\n\x1a\n": "image/png",
+    b"\xff\xd8\xff": "image/jpeg",
+    b"GIF87a": "image/gif",
+    b"GIF89a": "image/gif",
+    b"BM": "image/bmp",
+}
+# Stored blobs are named after the detected type, never the client's name.
+IMAGE_EXTENSIONS: dict[str, str] = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/bmp": ".bmp",
+    "image/webp": ".webp",
+}
+SIGNATURE_LENGTH = 12
+
+
+class RejectedUpload(BadRequest):
+    status_code = 400
+
+
+class UploadTooLarge(RejectedUpload):
+    status_code = 413
+
+
+def sniff_image_type(head: bytes) -> Union[str, None]:
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+
+    for signature, content_type in IMAGE_SIGNATURES.items():
+        if head.startswith(signature):
+            return content_type
+
+    return None
+
+
+class ContentHashUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams uploads to a temporary file while hashing them, so
+    ``ContentAddressedStorage`` can rename them into place (or drop them as
+    duplicates) without reading them again.
+
+    Uploads larger than ``BANNER_MAX_UPLOAD_SIZE`` or that do not start with
+    a known image signature are rejected as soon as the offending chunk
+    arrives, the rest of the request body is never read.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.max_size: int = settings.BANNER_MAX_UPLOAD_SIZE
+
+    def new_file(self, *args: Any, **kwargs: Any) -> None:
+        super().new_file(*args, **kwargs)
+        if self.content_length and self.content_length > self.max_size:
+            self._reject(UploadTooLarge(self._too_large_message()))
+
+        self.sha256 = hashlib.sha256()
+        self.head = b""
+
+    def receive_data_chunk(self, raw_data: bytes, start: int) -> None:
+        if start + len(raw_data) > self.max_size:
+            self._reject(UploadTooLarge(self._too_large_message()))
+
+        if len(self.head) < SIGNATURE_LENGTH:
+            self.head += raw_data[: SIGNATURE_LENGTH - len(self.head)]
+            if len(self.head) == SIGNATURE_LENGTH:
+                self._check_signature()
+
+        self.sha256.update(raw_data)
+        super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size: int) -> TemporaryUploadedFile:
+        if len(self.head) < SIGNATURE_LENGTH:
+            self._check_signature()
+
+        file = super().file_complete(file_size)
+        file.sha256 = self.sha256.hexdigest()
+        file.image_type = file.content_type
+        return file
+
+    def _check_signature(self) -> None:
+        content_type = sniff_image_type(self.head)
+        if content_type is None:
+            self._reject(
+                RejectedUpload(f"{self.file_name} is not a supported image")
+            )
+
+        self.file.content_type = content_type
+
+    def _too_large_message(self) -> str:
+        return (
+            f"{self.file_name} is larger than {self.max_size} bytes, the "
+            "maximum allowed upload size"
+        )
+
+    def _reject(self, exc: RejectedUpload) -> None:
+        self.upload_interrupted()
+        raise exc
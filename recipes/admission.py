@@ -0,0 +1,215 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Union
+
+from django.conf import settings
+from django.http import HttpRequest
+
+
+READ = "read"
+WRITE = "write"
+
+
+class Overloaded(Exception):
+    """A request turned away, to be answered with ``status``."""
+
+    def __init__(self, status: int, retry_after: float, message: str):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionQueue:
+    """
+    Lets at most ``limit`` requests execute at once (no limit at 0), the
+    others wait for a slot.
+    """
+
+    def __init__(self, name: str, limit: int) -> None:
+        self.name = name
+        self.limit = limit
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self._slots = threading.Semaphore(limit) if limit > 0 else None
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for a slot."""
+        with self._lock:
+            self.waiting += 1
+        acquired = False
+        try:
+            acquired = self._slots is None or self._slots.acquire(
+                timeout=timeout
+            )
+        finally:
+            with self._lock:
+                self.waiting -= 1
+                if acquired:
+                    self.in_flight += 1
+                    self.admitted += 1
+                else:
+                    self.shed += 1
+        return acquired
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now."""
+        if self._slots is not None and not self._slots.acquire(False):
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+
+class TokenBuckets:
+    """
+    One token bucket per client key, refilled at ``rate`` tokens per second
+    up to ``burst``. Only the ``max_clients`` most recent clients are
+    remembered. A ``rate`` of 0 disables the limit.
+    """
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str) -> float:
+        """
+        Take a token for ``key``, return 0 on success, otherwise the seconds
+        until one is available.
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """
+    Admission control of one worker process. Reads and writes (mutations
+    and uploads) queue separately, so slow writes cannot starve reads and a
+    burst of expensive reads cannot block writes.
+    """
+
+    def __init__(
+        self,
+        max_reads: int,
+        max_writes: int,
+        queue_timeout: float,
+        rate: float,
+        burst: int,
+    ) -> None:
+        self.queues = {
+            READ: AdmissionQueue(READ, max_reads),
+            WRITE: AdmissionQueue(WRITE, max_writes),
+        }
+        self.queue_timeout = queue_timeout
+        self.buckets = TokenBuckets(rate, burst)
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    def limit_rate(self, client: str) -> None:
+        """
+        Take a token of ``client``, raise ``Overloaded`` (429) when it spent
+        its budget. Checked before anything else looks at the request.
+        """
+        wait = self.buckets.take(client)
+        if wait:
+            with self._lock:
+                self.rate_limited += 1
+            raise Overloaded(429, wait, "Too many requests.")
+
+    @contextmanager
+    def admit(self, write: bool = False) -> Iterator[None]:
+        """
+        Hold a slot of the read or write queue while the block runs. Raises
+        ``Overloaded`` (503) when no slot frees up within ``queue_timeout``.
+        """
+        queue = self.queues[WRITE if write else READ]
+        if not queue.acquire(self.queue_timeout):
+            raise Overloaded(
+                503, self.queue_timeout, "The server is too busy."
+            )
+        try:
+            yield
+        finally:
+            queue.release()
+
+    @contextmanager
+    def borrow(self, count: int, write: bool = False) -> Iterator[int]:
+        """
+        Hold up to ``count`` more slots of the read or write queue, only the
+        ones free right now, for an admitted request running its work on
+        several threads. Yields how many it got.
+        """
+        queue = self.queues[WRITE if write else READ]
+        taken = 0
+        try:
+            while taken < count and queue.try_acquire():
+                taken += 1
+            yield taken
+        finally:
+            for _ in range(taken):
+                queue.release()
+
+
+def client_key(request: HttpRequest) -> str:
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+
+    # Behind proxies, ADMISSION_CLIENT_IP_HEADER names the META key holding
+    # the client address. Each proxy appends the address it got the request
+    # from, the client can put anything left of them: the client's is the
+    # one appended by the first of the ADMISSION_TRUSTED_PROXY_HOPS proxies.
+    header = request.META.get(settings.ADMISSION_CLIENT_IP_HEADER, "")
+    addresses = [address.strip() for address in header.split(",")]
+    hops = max(settings.ADMISSION_TRUSTED_PROXY_HOPS, 1)
+    return f"ip:{addresses[-min(hops, len(addresses))]}"
+
+
+_controller: Union[AdmissionController, None] = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    global _controller  # pylint: disable=global-statement
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController(
+                max_reads=settings.ADMISSION_MAX_READS,
+                max_writes=settings.ADMISSION_MAX_WRITES,
+                queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+                rate=settings.ADMISSION_RATE,
+                burst=settings.ADMISSION_BURST,
+            )
+        return _controller
@@ -2,16 +2,37 @@
 ASGI config for recipes project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django, websockets on ``/graphql/`` serve GraphQL subscriptions.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
 import os
+from typing import Any
 
 from django.core.asgi import get_asgi_application
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "recipes.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up, they need the app registry.
+from recipes.schemas import SCHEMA  # pylint: disable=wrong-import-position
+from recipes.subscriptions import (  # pylint: disable=wrong-import-position
+    GraphQLWebSocketApp,
+)
+
+
+websocket_application = GraphQLWebSocketApp(SCHEMA)
+
+
+async def application(scope: Any, receive: Any, send: Any) -> None:
+    if scope["type"] != "websocket":
+        await django_application(scope, receive, send)
+    elif scope["path"] == "/graphql/":
+        await websocket_application(scope, receive, send)
+    else:
+        await receive()
+        await send({"type": "websocket.close", "code": 4404})
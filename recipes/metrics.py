@@ -0,0 +1,117 @@
+import ipaddress
+from collections.abc import Iterator
+from typing import NamedTuple
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
+
+from food.cache import get_entity_cache
+from recipes.admission import get_admission_controller
+
+
+Labels = dict[str, str]
+
+
+class Metric(NamedTuple):
+    name: str
+    kind: str
+    help: str
+    samples: list[tuple[Labels, float]]
+
+
+def collect() -> Iterator[Metric]:
+    controller = get_admission_controller()
+    queues = list(controller.queues.values())
+
+    def per_queue(attr: str) -> list[tuple[Labels, float]]:
+        return [({"queue": q.name}, getattr(q, attr)) for q in queues]
+
+    yield Metric(
+        "graphql_admission_waiting",
+        "gauge",
+        "Requests waiting for an execution slot.",
+        per_queue("waiting"),
+    )
+    yield Metric(
+        "graphql_admission_in_flight",
+        "gauge",
+        "Requests executing.",
+        per_queue("in_flight"),
+    )
+    yield Metric(
+        "graphql_admission_admitted_total",
+        "counter",
+        "Requests given an execution slot.",
+        per_queue("admitted"),
+    )
+    yield Metric(
+        "graphql_admission_shed_total",
+        "counter",
+        "Requests turned away, by queue timeout (503) or rate limit (429).",
+        [({"reason": "timeout", "queue": q.name}, q.shed) for q in queues]
+        + [({"reason": "rate"}, controller.rate_limited)],
+    )
+    yield Metric(
+        "graphql_admission_clients",
+        "gauge",
+        "Clients with a token bucket.",
+        [({}, len(controller.buckets))],
+    )
+
+    cache = get_entity_cache()
+    yield Metric(
+        "entity_cache_lookups_total",
+        "counter",
+        "Rows looked up by id, by model and tier answering them.",
+        [
+            ({"model": model, "result": result}, count)
+            for (model, result), count in sorted(cache.stats.items())
+        ],
+    )
+    yield Metric(
+        "entity_cache_entries",
+        "gauge",
+        "Rows held in the in-process tier.",
+        [({}, len(cache))],
+    )
+
+
+def render(metrics: Iterator[Metric]) -> str:
+    """Format ``metrics`` in the Prometheus text exposition format."""
+    lines: list[str] = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in metric.samples:
+            label = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(
+                f"{metric.name}{{{label}}} {value}"
+                if label
+                else f"{metric.name} {value}"
+            )
+    return "\n".join(lines) + "\n"
+
+
+def allowed(request: HttpRequest) -> bool:
+    """Whether ``request`` comes from staff or from METRICS_ALLOWED_IPS."""
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in settings.METRICS_ALLOWED_IPS
+    )
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """Metrics of this worker process, for Prometheus to scrape."""
+    if not allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render(collect()), content_type="text/plain; version=0.0.4"
+    )
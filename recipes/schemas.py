@@ -1,6 +1,6 @@
 import graphene
 
-from food.schemas import FoodMutation, FoodQuery
+from food.schemas import FoodMutation, FoodQuery, FoodSubscription
 
 
 class Query(FoodQuery, graphene.ObjectType):
@@ -14,4 +14,10 @@ class Mutation(FoodMutation, graphene.ObjectType):
     pass
 
 
-SCHEMA = graphene.Schema(query=Query, mutation=Mutation)
+class Subscription(FoodSubscription, graphene.ObjectType):
+    pass
+
+
+SCHEMA = graphene.Schema(
+    query=Query, mutation=Mutation, subscription=Subscription
+)
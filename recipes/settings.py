@@ -10,7 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 from email.policy import default
-from decouple import config
+from decouple import Csv, config
 from pathlib import Path
 
 import django_stubs_ext
@@ -140,6 +140,98 @@ STATIC_ROOT = BASE_DIR / "static"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Uploads are hashed while they stream to disk and stored by content, so a
+# banner shared by several cuisines is only kept once.
+DEFAULT_FILE_STORAGE = "food.storage.ContentAddressedStorage"
+FILE_UPLOAD_HANDLERS = ["food.uploadhandler.ContentHashUploadHandler"]
+BANNER_MAX_UPLOAD_SIZE = 5 * 1024 * 1024
+# Unreferenced blobs reused by an upload within this many seconds are kept,
+# its row may not be committed yet. `manage.py sweep_blobs` removes them.
+BLOB_RELEASE_GRACE = config("BLOB_RELEASE_GRACE", default=3600, cast=int)
+
+# Set to "X-Accel-Redirect" (nginx) or "X-Sendfile" (apache, lighttpd) to let
+# the front proxy send media files once Django has checked the request.
+MEDIA_OFFLOAD_HEADER = config("MEDIA_OFFLOAD_HEADER", default="")
+MEDIA_OFFLOAD_PREFIX = config(
+    "MEDIA_OFFLOAD_PREFIX", default="/protected-media/"
+)
+
+# A POST to /graphql/ may carry a JSON array of operations. Batches made only
+# of queries run on this many threads, each with its own database connection,
+# keep it at 1 on SQLite.
+GRAPHQL_BATCH_MAX_SIZE = 20
+GRAPHQL_BATCH_MAX_WORKERS = config(
+    "GRAPHQL_BATCH_MAX_WORKERS", default=1, cast=int
+)
+
+# Cuisine and ingredient rows looked up by id are cached in each process
+# (at most ENTITY_CACHE_MAX_ENTRIES, ENTITY_CACHE_LOCAL_TIMEOUT seconds),
+# then in the CACHES alias named by ENTITY_CACHE_ALIAS when set. Changes
+# invalidate both tiers of the process making them, other processes see
+# them once their local entry expires.
+ENTITY_CACHE_MAX_ENTRIES = 10000
+ENTITY_CACHE_LOCAL_TIMEOUT = 30.0
+ENTITY_CACHE_ALIAS = config("ENTITY_CACHE_ALIAS", default="")
+ENTITY_CACHE_SHARED_TIMEOUT = 300
+
+# The autocomplete indexes of each process are read again once another one
+# committed a change to their rows, counted in this CACHES alias: share it
+# between processes (the default local memory cache only covers one).
+AUTOCOMPLETE_CACHE_ALIAS = config(
+    "AUTOCOMPLETE_CACHE_ALIAS", default="default"
+)
+
+# Admission control of /graphql/, per worker process. At most
+# ADMISSION_MAX_READS queries and ADMISSION_MAX_WRITES mutations or uploads
+# execute at once (0 for no limit), requests waiting longer than
+# ADMISSION_QUEUE_TIMEOUT seconds for a slot are answered with a 503. Each
+# client (user, or address from ADMISSION_CLIENT_IP_HEADER) may send
+# ADMISSION_RATE requests per second with bursts of ADMISSION_BURST, a 429
+# otherwise (0 disables it). Counters are served at /metrics/, see below.
+# With ADMISSION_CLIENT_IP_HEADER set to a forwarded-for header, such as
+# HTTP_X_FORWARDED_FOR, ADMISSION_TRUSTED_PROXY_HOPS is the number of proxies
+# appending to it: the client address is that many entries from the right.
+ADMISSION_MAX_READS = config("ADMISSION_MAX_READS", default=8, cast=int)
+ADMISSION_MAX_WRITES = config("ADMISSION_MAX_WRITES", default=2, cast=int)
+ADMISSION_QUEUE_TIMEOUT = config(
+    "ADMISSION_QUEUE_TIMEOUT", default=2.0, cast=float
+)
+ADMISSION_RATE = config("ADMISSION_RATE", default=20.0, cast=float)
+ADMISSION_BURST = config("ADMISSION_BURST", default=100, cast=int)
+ADMISSION_CLIENT_IP_HEADER = config(
+    "ADMISSION_CLIENT_IP_HEADER", default="REMOTE_ADDR"
+)
+ADMISSION_TRUSTED_PROXY_HOPS = config(
+    "ADMISSION_TRUSTED_PROXY_HOPS", default=1, cast=int
+)
+
+# /metrics/ only answers staff users and requests whose REMOTE_ADDR is in
+# these addresses or networks. Requests relayed by a proxy carry its address:
+# list it only if the proxy does not expose /metrics/ publicly.
+METRICS_ALLOWED_IPS = config(
+    "METRICS_ALLOWED_IPS", default="127.0.0.1,::1", cast=Csv()
+)
+
+# Fan-out of the recipeChanged/cuisineChanged subscriptions. The in-memory
+# layer only reaches websockets of the same process. Subscribers falling more
+# than SUBSCRIPTION_MAX_PENDING events behind lose the oldest ones.
+SUBSCRIPTION_CHANNEL_LAYER = "food.events.InMemoryChannelLayer"
+SUBSCRIPTION_MAX_PENDING = 100
+
+# similarRecipes ranks recipes from a recipe x ingredient matrix. When set,
+# workers share it as memory-mapped files in this directory, rebuild it from
+# the database with `manage.py build_similarity_index`. Changes made by a
+# worker are merged into its copy once SIMILARITY_COMPACT_AFTER pile up, and
+# only reach the other workers with the next snapshot: one is rebuilt by the
+# first worker seeing the current one older than SIMILARITY_REBUILD_AFTER
+# seconds (0 leaves it to a scheduled build_similarity_index). Without a
+# directory, each worker rebuilds its own matrix that often instead.
+SIMILARITY_SNAPSHOT_DIR = config("SIMILARITY_SNAPSHOT_DIR", default="")
+SIMILARITY_COMPACT_AFTER = 1000
+SIMILARITY_REBUILD_AFTER = config(
+    "SIMILARITY_REBUILD_AFTER", default=3600, cast=float
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,284 @@
+import asyncio
+import json
+import logging
+from collections.abc import Iterator
+from typing import Any, Awaitable, Callable, Union
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from graphql import GraphQLError, parse, validate
+from graphql.error import format_error
+from graphql.execution import ExecutionResult
+from graphql.execution.values import get_argument_values
+from graphql.language import ast
+from graphql.utils.get_operation_ast import get_operation_ast
+
+from food.events import ChannelLayer, get_channel_layer
+from food.schemas import SUBSCRIPTION_GROUPS
+
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL = "graphql-transport-ws"
+Scope = dict[str, Any]
+Receive = Callable[[], Awaitable[dict[str, Any]]]
+Send = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+class SubscriptionContext:
+    """Stands in for the request as ``info.context`` of websocket events."""
+
+    def __init__(self, scope: Scope) -> None:
+        self.scope = scope
+        headers = dict(scope.get("headers", []))
+        self.host = headers.get(b"host", b"").decode("latin1")
+        self.scheme = "https" if scope.get("scheme") == "wss" else "http"
+
+    def build_absolute_uri(self, location: str) -> str:
+        return f"{self.scheme}://{self.host}{location}"
+
+
+class GraphQLWebSocketApp:
+    """
+    ASGI application serving GraphQL subscriptions over websockets with the
+    ``graphql-transport-ws`` protocol.
+
+    Each ``subscribe`` message subscribes to the channel layer group of its
+    subscription field (narrowed by its ``cuisineId`` argument), then
+    executes the document once per event with the event as root value.
+    """
+
+    def __init__(
+        self, schema: Any, layer: Union[ChannelLayer, None] = None
+    ) -> None:
+        self.schema = schema
+        self.layer = layer
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+
+        if PROTOCOL not in scope.get("subprotocols", []):
+            await send({"type": "websocket.close", "code": 4406})
+            return
+
+        await send({"type": "websocket.accept", "subprotocol": PROTOCOL})
+        await Connection(self, scope, send).run(receive)
+
+    def get_layer(self) -> ChannelLayer:
+        return self.layer or get_channel_layer()
+
+
+class Connection:
+    def __init__(
+        self, app: GraphQLWebSocketApp, scope: Scope, send: Send
+    ) -> None:
+        self.app = app
+        self.scope = scope
+        self._send = send
+        self.acknowledged = False
+        self.operations: dict[str, asyncio.Task[None]] = {}
+
+    async def send(self, message: dict[str, Any]) -> None:
+        await self._send(
+            {"type": "websocket.send", "text": json.dumps(message)}
+        )
+
+    async def close(self, code: int, reason: str) -> None:
+        await self._send(
+            {"type": "websocket.close", "code": code, "reason": reason}
+        )
+
+    async def run(self, receive: Receive) -> None:
+        try:
+            while True:
+                event = await receive()
+                if event["type"] == "websocket.disconnect":
+                    return
+                if event["type"] == "websocket.receive":
+                    await self.handle(event.get("text") or "")
+        finally:
+            for task in self.operations.values():
+                task.cancel()
+
+    async def handle(self, text: str) -> None:
+        try:
+            message = json.loads(text)
+            kind = message["type"]
+        except (ValueError, TypeError, KeyError):
+            await self.close(4400, "invalid message")
+            return
+
+        if kind == "connection_init":
+            if self.acknowledged:
+                await self.close(4429, "too many initialisation requests")
+                return
+            self.acknowledged = True
+            await self.send({"type": "connection_ack"})
+        elif kind == "ping":
+            await self.send({"type": "pong"})
+        elif kind == "pong":
+            pass
+        elif not self.acknowledged:
+            await self.close(4401, "unauthorized")
+        elif kind == "subscribe":
+            await self.subscribe(message.get("id"), message.get("payload"))
+        elif kind == "complete":
+            task = self.operations.pop(message.get("id"), None)
+            if task:
+                task.cancel()
+        else:
+            await self.close(4400, f"unknown message type {kind}")
+
+    async def subscribe(self, op_id: Any, payload: Any) -> None:
+        if not isinstance(op_id, str) or not isinstance(payload, dict):
+            await self.close(4400, "invalid subscribe message")
+            return
+        if op_id in self.operations:
+            await self.close(4409, f"subscriber for {op_id} already exists")
+            return
+
+        self.operations[op_id] = asyncio.ensure_future(
+            self.operate(op_id, payload)
+        )
+
+    async def operate(self, op_id: str, payload: dict[str, Any]) -> None:
+        variables = payload.get("variables") or {}
+        operation_name = payload.get("operationName")
+        try:
+            document = parse(payload.get("query") or "")
+            errors = validate(self.app.schema, document)
+            if errors:
+                raise errors[0]
+            operation = get_operation_ast(document, operation_name)
+            if operation is None:
+                raise GraphQLError("unknown operation")
+            group = self.group(document, operation, variables)
+        except GraphQLError as exc:
+            await self.send(
+                {"type": "error", "id": op_id, "payload": [format_error(exc)]}
+            )
+            self.operations.pop(op_id, None)
+            return
+
+        execute = sync_to_async(self.execute)
+        try:
+            if group is None:
+                result = await execute(
+                    document, None, variables, operation_name
+                )
+                await self.send(
+                    {"type": "next", "id": op_id, "payload": result}
+                )
+            else:
+                subscription = self.app.get_layer().subscribe(group)
+                try:
+                    async for event in subscription:
+                        result = await execute(
+                            document, event, variables, operation_name
+                        )
+                        await self.send(
+                            {"type": "next", "id": op_id, "payload": result}
+                        )
+                finally:
+                    subscription.close()
+        except asyncio.CancelledError:
+            return
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception("subscription %s failed", op_id)
+            self.operations.pop(op_id, None)
+            await self.send(
+                {
+                    "type": "error",
+                    "id": op_id,
+                    "payload": [{"message": str(exc)}],
+                }
+            )
+            return
+
+        self.operations.pop(op_id, None)
+        await self.send({"type": "complete", "id": op_id})
+
+    def group(
+        self,
+        document: ast.Document,
+        operation: ast.OperationDefinition,
+        variables: dict[str, Any],
+    ) -> Union[str, None]:
+        """Channel layer group of a subscription, ``None`` for queries."""
+        if operation.operation != "subscription":
+            if operation.operation != "query":
+                raise GraphQLError(
+                    "only queries and subscriptions are allowed"
+                )
+            return None
+
+        fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, ast.FragmentDefinition)
+        }
+        fields = list(root_fields(operation.selection_set, fragments))
+        if len(fields) != 1:
+            raise GraphQLError("a subscription must select exactly one field")
+
+        field = fields[0]
+        name = field.name.value
+        subscription_type = self.app.schema.get_subscription_type()
+        try:
+            field_def = subscription_type.fields[name]
+            group = SUBSCRIPTION_GROUPS[name]
+        except (AttributeError, KeyError):
+            raise GraphQLError(f"cannot subscribe to {name}") from None
+        args = get_argument_values(field_def.args, field.arguments, variables)
+        return group(**args)
+
+    def execute(
+        self,
+        document: ast.Document,
+        event: Any,
+        variables: dict[str, Any],
+        operation_name: Union[str, None],
+    ) -> dict[str, Any]:
+        close_old_connections()
+        try:
+            result = self.app.schema.execute(
+                document,
+                root_value=event,
+                context_value=SubscriptionContext(self.scope),
+                variable_values=variables,
+                operation_name=operation_name,
+                allow_subscriptions=event is not None,
+            )
+            if not isinstance(result, ExecutionResult):
+                # Subscription fields resolve to an observable emitting the
+                # event once.
+                results: list[ExecutionResult] = []
+                result.subscribe(results.append)
+                result = results[0]
+        finally:
+            close_old_connections()
+
+        response: dict[str, Any] = {"data": result.data}
+        if result.errors:
+            response["errors"] = [format_error(e) for e in result.errors]
+        return response
+
+
+def root_fields(
+    selection_set: ast.SelectionSet,
+    fragments: dict[str, ast.FragmentDefinition],
+) -> Iterator[ast.Field]:
+    """Fields of ``selection_set``, with its fragments spread in place."""
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            yield selection
+        elif isinstance(selection, ast.FragmentSpread):
+            yield from root_fields(
+                fragments[selection.name.value].selection_set, fragments
+            )
+        else:
+            yield from root_fields(selection.selection_set, fragments)
@@ -17,9 +17,10 @@ from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_file_upload.django import FileUploadGraphQLView
 
+from recipes.metrics import metrics_view
 from recipes.schemas import SCHEMA
+from recipes.views import GraphQLView, serve_media
 
 
 urlpatterns = [
@@ -27,9 +28,9 @@ urlpatterns = [
     path(
         "graphql/",
         csrf_exempt(
-            FileUploadGraphQLView.as_view(
-                graphiql=settings.DEBUG, schema=SCHEMA
-            )
+            GraphQLView.as_view(graphiql=settings.DEBUG, schema=SCHEMA)
         ),
     ),
+    path("metrics/", metrics_view),
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", serve_media),
 ]
@@ -0,0 +1,354 @@
+import mimetypes
+import os
+import re
+import stat
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Union
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import connections
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    StreamingHttpResponse,
+)
+from django.http.response import HttpResponseBase
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from graphene_django.views import HttpError
+from graphene_file_upload.django import FileUploadGraphQLView
+
+from food.loaders import ObjectCache
+from food.storage import blob_digest
+from food.uploadhandler import IMAGE_EXTENSIONS, RejectedUpload
+from recipes.admission import Overloaded, client_key, get_admission_controller
+
+
+BYTE_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+CHUNK_SIZE = 64 * 1024
+# Only images are served inline, anything else is a download.
+SERVED_CONTENT_TYPES = frozenset(IMAGE_EXTENSIONS)
+
+
+class GraphQLView(FileUploadGraphQLView):
+    """
+    GraphQL endpoint accepting either one operation or a JSON array of
+    operations (batch). Every operation of a request shares the request's
+    ``ObjectCache``. With ``GRAPHQL_BATCH_MAX_WORKERS`` above one, batches
+    made only of queries run in a thread pool, as large as the free read
+    slots allow; mutations always run in order.
+
+    Requests go through the worker's admission control first, see
+    ``recipes.admission``.
+    """
+
+    def dispatch(
+        self, request: HttpRequest, *args: Any, **kwargs: Any
+    ) -> HttpResponseBase:
+        request.object_cache = ObjectCache()
+        controller = get_admission_controller()
+        try:
+            controller.limit_rate(client_key(request))
+            with controller.admit(self.is_write(request)):
+                if request.method == "POST":
+                    data = self.parse_body(request)
+                    if self.batch:
+                        return self.dispatch_batch(request, data)
+                return super().dispatch(request, *args, **kwargs)
+        except HttpError as exc:
+            return self.error_response(request, exc)
+        except Overloaded as exc:
+            response = HttpResponse(status=exc.status)
+            response["Retry-After"] = str(exc.retry_after)
+            return self.error_response(request, HttpError(response, str(exc)))
+
+    def is_write(self, request: HttpRequest) -> bool:
+        """
+        Whether the request runs a mutation or uploads files, which are
+        admitted separately from queries.
+        """
+        if request.method != "POST":
+            return False
+        # Uploads are streamed while the body is parsed, which happens
+        # once admitted.
+        if self.get_content_type(request) == "multipart/form-data":
+            return True
+
+        data = self.parse_body(request)
+        return not all(
+            self.is_query(request, entry)
+            for entry in (data if self.batch else [data])
+        )
+
+    def parse_body(self, request: HttpRequest) -> Any:
+        # ``dispatch`` looks at the body before the base view does.
+        if not hasattr(self, "_body"):
+            self._body = self._parse_body(request)
+        return self._body
+
+    def _parse_body(self, request: HttpRequest) -> Any:
+        content_type = self.get_content_type(request)
+        if content_type == "application/json":
+            self.batch = request.body.lstrip()[:1] == b"["
+
+        try:
+            data = super().parse_body(request)
+        except RejectedUpload as exc:
+            raise HttpError(HttpResponse(status=exc.status_code), str(exc))
+
+        if isinstance(data, list):
+            self.batch = True
+            if len(data) > settings.GRAPHQL_BATCH_MAX_SIZE:
+                raise HttpError(
+                    HttpResponseBadRequest(
+                        f"Batches are limited to "
+                        f"{settings.GRAPHQL_BATCH_MAX_SIZE} operations."
+                    )
+                )
+            if not all(isinstance(entry, dict) for entry in data):
+                raise HttpError(
+                    HttpResponseBadRequest(
+                        "Batch entries must be JSON objects."
+                    )
+                )
+
+        return data
+
+    def dispatch_batch(
+        self, request: HttpRequest, data: list[Any]
+    ) -> HttpResponseBase:
+        responses = self.execute_batch(request, data)
+        return HttpResponse(
+            status=max(status for _, status in responses),
+            content="[{}]".format(",".join(result for result, _ in responses)),
+            content_type="application/json",
+        )
+
+    def execute_batch(
+        self, request: HttpRequest, data: list[Any]
+    ) -> list[tuple[str, int]]:
+        workers = min(settings.GRAPHQL_BATCH_MAX_WORKERS, len(data))
+        if workers <= 1 or not all(
+            self.is_query(request, entry) for entry in data
+        ):
+            return [self.get_response(request, entry) for entry in data]
+
+        # The request holds one read slot, every other thread takes a free
+        # one of its own.
+        with get_admission_controller().borrow(workers - 1) as borrowed:
+            if not borrowed:
+                return [self.get_response(request, entry) for entry in data]
+            with ThreadPoolExecutor(borrowed + 1) as pool:
+                return list(
+                    pool.map(
+                        partial(self.get_threaded_response, request), data
+                    )
+                )
+
+    def get_threaded_response(
+        self, request: HttpRequest, data: Any
+    ) -> tuple[str, int]:
+        try:
+            return self.get_response(request, data)
+        finally:
+            # Worker threads opened their own connections.
+            connections.close_all()
+
+    def is_query(self, request: HttpRequest, data: Any) -> bool:
+        query, _, operation_name, _ = self.get_graphql_params(request, data)
+        try:
+            document = self.get_backend(request).document_from_string(
+                self.schema, query
+            )
+        except Exception:  # pylint: disable=broad-except
+            # Invalid documents are reported by ``get_response``.
+            return True
+
+        return document.get_operation_type(operation_name) == "query"
+
+    def error_response(
+        self, request: HttpRequest, exc: HttpError
+    ) -> HttpResponseBase:
+        response = exc.response
+        response["Content-Type"] = "application/json"
+        response.content = self.json_encode(
+            request, {"errors": [self.format_error(exc)]}
+        )
+        return response
+
+
+def parse_byte_range(
+    header: str, size: int
+) -> Union[tuple[int, int], None, bool]:
+    """
+    Parse a single ``bytes=`` range into an inclusive ``(start, end)``.
+
+    Returns ``None`` when the header should be ignored (missing, malformed or
+    a multi-range request, which is answered with the whole file) and
+    ``False`` when the range cannot be satisfied.
+    """
+    match = BYTE_RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            return False
+        return max(size - suffix, 0), size - 1
+
+    start = int(first)
+    if start >= size:
+        return False
+
+    end = min(int(last), size - 1) if last else size - 1
+    if end < start:
+        return None
+
+    return start, end
+
+
+def read_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_media(request: HttpRequest, path: str) -> HttpResponseBase:
+    """
+    Serve files stored under ``MEDIA_ROOT`` (cuisine banners).
+
+    Supports single byte ranges, strong ETags and conditional requests.
+    Content-addressed blobs never change and are cached as immutable. When
+    ``MEDIA_OFFLOAD_HEADER`` is set, the body is left to the front proxy
+    (``X-Accel-Redirect`` or ``X-Sendfile``) after the conditional checks.
+    Only image types are served inline, anything else is an attachment.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+
+    if any(part.startswith(".") for part in path.split("/")):
+        raise Http404("file not found")
+
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        st = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404("file not found")
+
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404("file not found")
+
+    digest = blob_digest(path)
+    etag = f'"{digest}"' if digest else f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    last_modified = int(st.st_mtime)
+    content_type, encoding = mimetypes.guess_type(full_path)
+    disposition = None
+    if content_type not in SERVED_CONTENT_TYPES:
+        # Never let a misnamed file render in the app's origin (HTML, SVG).
+        content_type, encoding = "application/octet-stream", None
+        disposition = "attachment"
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Accept-Ranges": "bytes",
+        "X-Content-Type-Options": "nosniff",
+    }
+    if disposition:
+        headers["Content-Disposition"] = disposition
+
+    response: Union[HttpResponseBase, None] = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+
+    if response is None and settings.MEDIA_OFFLOAD_HEADER:
+        response = HttpResponse(content_type=content_type)
+        if settings.MEDIA_OFFLOAD_HEADER.lower() == "x-sendfile":
+            response[settings.MEDIA_OFFLOAD_HEADER] = full_path
+        else:
+            response[settings.MEDIA_OFFLOAD_HEADER] = (
+                settings.MEDIA_OFFLOAD_PREFIX + path
+            )
+
+    if response is None:
+        response = _file_response(request, full_path, st.st_size, etag)
+        response["Content-Type"] = content_type
+        if encoding:
+            response["Content-Encoding"] = encoding
+
+    for header, value in headers.items():
+        response[header] = value
+
+    if digest:
+        patch_cache_control(
+            response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True
+        )
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+
+    return response
+
+
+def _file_response(
+    request: HttpRequest, full_path: str, size: int, etag: str
+) -> HttpResponseBase:
+    byte_range = None
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if "HTTP_RANGE" in request.META and (
+        not if_range or _if_range_passes(if_range, etag, full_path)
+    ):
+        byte_range = parse_byte_range(request.META["HTTP_RANGE"], size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        response = (
+            HttpResponse(status=206)
+            if request.method == "HEAD"
+            else StreamingHttpResponse(
+                read_range(full_path, start, end), status=206
+            )
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+        return response
+
+    if request.method == "HEAD":
+        response = HttpResponse()
+        response["Content-Length"] = str(size)
+        return response
+
+    # FileResponse lets the WSGI server use ``wsgi.file_wrapper`` (sendfile).
+    return FileResponse(open(full_path, "rb"))
+
+
+def _if_range_passes(if_range: str, etag: str, full_path: str) -> bool:
+    if if_range.startswith(('"', "W/")):
+        return if_range == etag
+
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(os.path.getmtime(full_path)) <= since